@@ -0,0 +1,44 @@
+"""
+Días locales (America/Asuncion) como rangos de fecha y hora.
+
+Filtrar con `created_at__date=d` obliga a la base a convertir cada fila a fecha
+local antes de comparar: no usa el índice de la columna (ni la poda de
+particiones de PageView). day_filter() arma la misma condición como un rango
+semiabierto [desde las 00:00 del primer día, hasta las 00:00 del día siguiente
+al último), que sí los usa:
+
+    PendingBooking.objects.filter(**day_filter('created_at', d, d))
+    PageView.objects.filter(**day_filter('timestamp', start))   # desde start
+"""
+import zoneinfo
+from datetime import date, datetime, time, timedelta
+
+ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
+
+
+def local_day(ts) -> date:
+    """El día local de un datetime aware."""
+    return ts.astimezone(ASUNCION).date()
+
+
+def day_start(day: date) -> datetime:
+    """Medianoche del día local, como datetime aware."""
+    return datetime.combine(day, time.min, tzinfo=ASUNCION)
+
+
+def day_range(first: date, last: date) -> tuple[datetime, datetime]:
+    """[inicio de first, inicio del día siguiente a last): los dos días incluidos."""
+    return day_start(first), day_start(last + timedelta(days=1))
+
+
+def day_filter(field: str, first: date | None = None, last: date | None = None) -> dict:
+    """
+    kwargs de filter() para los días locales first..last, incluidos. Sin first
+    o sin last, ese lado queda abierto.
+    """
+    bounds = {}
+    if first is not None:
+        bounds[f'{field}__gte'] = day_start(first)
+    if last is not None:
+        bounds[f'{field}__lt'] = day_start(last + timedelta(days=1))
+    return bounds
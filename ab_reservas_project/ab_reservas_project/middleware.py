@@ -0,0 +1,96 @@
+"""
+Middleware del proyecto.
+
+AsyncWhiteNoiseMiddleware: WhiteNoiseMiddleware es solo sync: bajo ASGI obliga
+a Django a correr en un hilo toda la cadena que tiene adentro, vistas async
+incluidas. Esta subclase declara los dos modos; los pedidos que no son
+estáticos siguen por el loop y solo el servido de un archivo (que abre y lee
+del disco) va a un hilo.
+
+QueryBudgetMiddleware: cuenta consultas y tiempo de base por request (ver
+querybudget.py).
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .querybudget import QueryTrace, finish
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+def _add_wrapper(trace):
+    connection.execute_wrappers.append(trace)
+
+
+def _remove_wrapper(trace):
+    connection.execute_wrappers.remove(trace)
+
+
+class QueryBudgetMiddleware:
+    """
+    Mide las consultas de cada request y las acumula por vista. En DEBUG
+    agrega los headers X-DB-Queries y X-DB-Time-Ms a la respuesta.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        trace = QueryTrace()
+        with connection.execute_wrapper(trace):
+            response = self.get_response(request)
+        return self._done(request, response, trace)
+
+    async def __acall__(self, request):
+        # Las conexiones son por hilo: las vistas async consultan desde el
+        # hilo de sync_to_async del request, así que el wrapper va ahí.
+        trace = QueryTrace()
+        await sync_to_async(_add_wrapper)(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_wrapper)(trace)
+        return self._done(request, response, trace)
+
+    def _done(self, request, response, trace):
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else None
+        if name:
+            finish(name, trace)
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(trace.count)
+            response['X-DB-Time-Ms'] = f'{trace.ms:.1f}'
+        return response
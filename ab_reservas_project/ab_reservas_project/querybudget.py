@@ -0,0 +1,148 @@
+"""
+Presupuesto de consultas SQL por request (y por tool del MCP).
+
+Cuenta las consultas y el tiempo de base de cada request con un
+execute_wrapper de Django. Si una vista pasa QUERY_BUDGET consultas o
+QUERY_BUDGET_MS milisegundos, deja un warning con las formas de SQL que más se
+repiten: un N+1 aparece como la misma consulta con distinto parámetro.
+
+Además acumula, por vista, llamadas, promedio y máximo. El reporte se ve en el
+admin (Analytics → Consultas por vista). Los números son del proceso que
+atiende: cada worker de uvicorn y el MCP llevan los suyos.
+
+Se engancha con QueryBudgetMiddleware (ab_reservas_project/middleware.py) y,
+en el MCP, con @tracked dentro de con_db.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+log = logging.getLogger(__name__)
+
+# Cuántas formas de SQL se muestran en el log y en el reporte.
+TOP_SHAPES = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'IN \((?:\?(?:, )?)+\)')
+_SPACES = re.compile(r'\s+')
+
+
+def sql_shape(sql):
+    """La consulta sin literales ni parámetros: igual para todo un N+1."""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACES.sub(' ', shape).strip()[:300]
+
+
+class QueryTrace:
+    """execute_wrapper que cuenta consultas, tiempo y formas."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    @property
+    def ms(self):
+        return self.seconds * 1000
+
+    def repeated(self):
+        return [(shape, n) for shape, n in self.shapes.most_common(TOP_SHAPES) if n > 1]
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}
+
+    def add(self, name, trace, over):
+        with self._lock:
+            s = self._by_name.setdefault(name, {
+                'name': name, 'calls': 0, 'queries': 0, 'ms': 0.0,
+                'max_queries': 0, 'max_ms': 0.0, 'over_budget': 0, 'worst_shapes': [],
+            })
+            s['calls'] += 1
+            s['queries'] += trace.count
+            s['ms'] += trace.ms
+            s['max_ms'] = max(s['max_ms'], trace.ms)
+            s['over_budget'] += over
+            if trace.count >= s['max_queries']:
+                s['max_queries'] = trace.count
+                s['worst_shapes'] = trace.shapes.most_common(TOP_SHAPES)
+
+    def report(self):
+        """Una fila por vista, las de más consultas promedio primero."""
+        with self._lock:
+            rows = [dict(s) for s in self._by_name.values()]
+        for row in rows:
+            row['avg_queries'] = row['queries'] / row['calls']
+            row['avg_ms'] = row['ms'] / row['calls']
+        return sorted(rows, key=lambda r: r['avg_queries'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._by_name.clear()
+
+
+stats = _Stats()
+
+
+def budget():
+    return settings.QUERY_BUDGET, settings.QUERY_BUDGET_MS
+
+
+def finish(name, trace):
+    """Acumula la medición y avisa si se pasó del presupuesto."""
+    max_queries, max_ms = budget()
+    over = trace.count > max_queries or trace.ms > max_ms
+    stats.add(name, trace, over)
+    if over:
+        repeated = '; '.join(f'{n}× {shape}' for shape, n in trace.repeated()) or '-'
+        log.warning(
+            'Presupuesto de consultas excedido en %s: %d consultas, %.0f ms '
+            '(límite %d / %.0f ms). Repetidas: %s',
+            name, trace.count, trace.ms, max_queries, max_ms, repeated,
+        )
+
+
+@contextmanager
+def track(name):
+    trace = QueryTrace()
+    try:
+        with connection.execute_wrapper(trace):
+            yield trace
+    finally:
+        finish(name, trace)
+
+
+def tracked(name=None):
+    """Decorador: mide cada llamada a `fn` (tools del MCP, comandos)."""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -61,7 +61,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ab_reservas_project.middleware.QueryBudgetMiddleware',
+    'ab_reservas_project.middleware.AsyncWhiteNoiseMiddleware',
     'app_analytics.middleware.PageViewMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +72,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Presupuesto de consultas por request / tool del MCP (querybudget.py). Las
+# vistas que lo pasan quedan en el log con las consultas más repetidas.
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '25'))
+QUERY_BUDGET_MS = float(os.environ.get('QUERY_BUDGET_MS', '300'))
+
+# Proxies propios delante de Django que agregan una entrada a X-Forwarded-For:
+# en producción Traefik y nginx (2), en desarrollo solo nginx (1). La IP del
+# cliente es la entrada que agregó el primero de ellos; lo que está más a la
+# izquierda lo manda el cliente y no sirve para identificarlo.
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', '1' if DEBUG else '2'))
+
+# Las visitas (PageView) se escriben en lote desde un hilo (app_analytics/buffer.py):
+# cada PAGEVIEW_BATCH_SIZE filas o PAGEVIEW_FLUSH_MS ms. Con la cola llena se descartan.
+PAGEVIEW_BATCH_SIZE = int(os.environ.get('PAGEVIEW_BATCH_SIZE', '100'))
+PAGEVIEW_FLUSH_MS = int(os.environ.get('PAGEVIEW_FLUSH_MS', '2000'))
+PAGEVIEW_QUEUE_MAX = int(os.environ.get('PAGEVIEW_QUEUE_MAX', '10000'))
+
 ROOT_URLCONF = 'ab_reservas_project.urls'
 
 TEMPLATES = [
@@ -182,6 +200,10 @@ STORAGES = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Archivo de las visitas crudas que borra cleanup_pageviews (app_analytics/archive.py).
+# Va en el volumen de media, pero nginx no sirve /media/archivo/. Vacío: no se archiva.
+PAGEVIEW_ARCHIVE_DIR = os.environ.get('PAGEVIEW_ARCHIVE_DIR', str(MEDIA_ROOT / 'archivo' / 'pageviews'))
+
 
 # ─── OAuth 2.1 (django-oauth-toolkit) ────────────────────────────────────────
 # Django actúa como authorization server del servicio MCP. El MCP es el resource
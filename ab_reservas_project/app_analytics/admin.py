@@ -8,7 +8,10 @@ from django.shortcuts import render
 from django.urls import path
 from django.utils import timezone
 
-from .models import PageView, PageViewMonthly, VALID_PAGES
+from ab_reservas_project.localtime import day_filter
+
+from . import rollup
+from .models import PageView, PageViewDaily, PageViewMonthly, VALID_PAGES
 
 _ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
 
@@ -31,24 +34,19 @@ def _build_stats(days_range: int):
     start = today - timedelta(days=days_range - 1)
     local_tz = _ASUNCION
 
-    # PageViews agregados por página y día
-    views_qs = (
-        PageView.objects
-        .filter(timestamp__date__gte=start)
-        .annotate(day=TruncDate('timestamp', tzinfo=local_tz))
-        .values('day', 'page')
-        .annotate(count=Count('id'))
-    )
+    # Vistas por página y día: días cerrados de PageViewDaily, hoy de PageView
+    visit_rows = rollup.visit_rows(start, today)
     views_by_day: dict[date, dict[str, int]] = {}
-    for row in views_qs:
-        views_by_day.setdefault(row['day'], {})[row['page']] = row['count']
+    for row in visit_rows:
+        pages = views_by_day.setdefault(row['day'], {})
+        pages[row['page']] = pages.get(row['page'], 0) + row['views']
 
     # Importar modelos de reservas aquí para evitar dependencia circular
     from app_fractalia.models import PendingBooking, Booking
 
     pending_qs = (
         PendingBooking.objects
-        .filter(created_at__date__gte=start)
+        .filter(**day_filter('created_at', start))
         .annotate(day=TruncDate('created_at', tzinfo=local_tz))
         .values('day')
         .annotate(count=Count('id'))
@@ -57,7 +55,7 @@ def _build_stats(days_range: int):
 
     confirmed_qs = (
         Booking.objects
-        .filter(created_at__date__gte=start)
+        .filter(**day_filter('created_at', start))
         .annotate(day=TruncDate('created_at', tzinfo=local_tz))
         .values('day')
         .annotate(count=Count('id'))
@@ -96,9 +94,7 @@ def _build_stats(days_range: int):
         'calendar': sum(d['calendar'] for d in days),
         'pending': sum(d['pending'] for d in days),
         'confirmed': sum(d['confirmed'] for d in days),
-        'unique_visitors': PageView.objects.filter(
-            timestamp__date__gte=start
-        ).values('ip_hash').distinct().count(),
+        'unique_visitors': rollup.unique_visitors(visit_rows),
     }
 
     # Funnel
@@ -168,9 +164,32 @@ class PageViewAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom = [
             path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='analytics_dashboard'),
+            path('consultas/', self.admin_site.admin_view(self.query_report_view), name='analytics_query_report'),
         ]
         return custom + urls
 
+    def query_report_view(self, request):
+        """
+        Consultas SQL por vista en este proceso (ab_reservas_project/querybudget.py).
+        Solo staff: admin_view ya lo exige.
+        """
+        from django.shortcuts import redirect
+        from ab_reservas_project.querybudget import budget, stats as query_stats
+
+        if request.method == 'POST':
+            query_stats.reset()
+            return redirect('admin:analytics_query_report')
+
+        max_queries, max_ms = budget()
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Consultas por vista',
+            'rows': query_stats.report(),
+            'max_queries': max_queries,
+            'max_ms': max_ms,
+        }
+        return render(request, 'app_analytics/query_report.html', context)
+
     def dashboard_view(self, request):
         try:
             days_range = int(request.GET.get('days', 30))
@@ -265,24 +284,17 @@ class PageViewAdmin(admin.ModelAdmin):
                         seen_ids.add(pb2.pk)
 
         # ── Tiempo de confirmación: PendingBooking.created_at → Booking.created_at ──
-        # Se calcula para las pre-reservas CONFIRMED del período cuya Booking
-        # tiene el código en notes (flujo normal de confirmación desde el admin).
-        confirmed_pbs = PendingBooking.objects.filter(
-            status='CONFIRMED',
-            created_at__date__gte=today - timedelta(days=days_range - 1),
-        ).values('reservation_code', 'created_at')
+        # Se calcula para las pre-reservas CONFIRMED del período, con la Booking
+        # que salió de cada una (Booking.pending_booking).
+        confirmed_pairs = Booking.objects.filter(
+            pending_booking__status='CONFIRMED',
+            **day_filter('pending_booking__created_at', today - timedelta(days=days_range - 1)),
+        ).values_list('created_at', 'pending_booking__created_at')
 
         response_hours = []
-        for pb in confirmed_pbs:
-            code = pb['reservation_code']
-            booking = (
-                Booking.objects
-                .filter(notes__contains=code)
-                .values('created_at')
-                .first()
-            )
-            if booking and booking['created_at']:
-                delta = (booking['created_at'] - pb['created_at']).total_seconds() / 3600
+        for booking_created, pb_created in confirmed_pairs:
+            if booking_created:
+                delta = (booking_created - pb_created).total_seconds() / 3600
                 if 0 < delta < 720:  # entre 0 y 30 días (excluir anomalías de seed)
                     response_hours.append(round(delta, 1))
 
@@ -296,7 +308,7 @@ class PageViewAdmin(admin.ModelAdmin):
         # ── Métricas ejecutivas de gestión (dentro del período seleccionado) ──
         period_start = today - timedelta(days=days_range - 1)
 
-        all_period = PendingBooking.objects.filter(created_at__date__gte=period_start)
+        all_period = PendingBooking.objects.filter(**day_filter('created_at', period_start))
         total_period    = all_period.count()
         confirmed_count  = all_period.filter(status='CONFIRMED').count()
         responded_count  = all_period.filter(status='RESPONDED').count()
@@ -429,13 +441,15 @@ class PageViewAdmin(admin.ModelAdmin):
         # Histórico mensual
         monthly = PageViewMonthly.objects.all().order_by('-year', '-month')[:24]
 
-        # Agregar totales mensuales para el chart (todos los pages sumados por mes)
-        monthly_map: dict[str, int] = {}
+        # Agregar totales mensuales para el chart (todos los pages sumados por mes).
+        # Los únicos del mes salen de unir los sketches de sus páginas.
+        monthly_map: dict[str, list] = {}
         for m in monthly:
             key = f"{m.year}/{m.month:02d}"
-            monthly_map[key] = monthly_map.get(key, 0) + m.total_views
-        chart_month_labels = list(reversed(list(monthly_map.keys())))
-        chart_month_views  = list(reversed(list(monthly_map.values())))
+            monthly_map.setdefault(key, []).append(m)
+        chart_month_labels   = list(reversed(list(monthly_map.keys())))
+        chart_month_views    = [sum(m.total_views for m in monthly_map[k]) for k in chart_month_labels]
+        chart_month_visitors = [rollup.monthly_unique_visitors(monthly_map[k]) for k in chart_month_labels]
 
         context = {
             **self.admin_site.each_context(request),
@@ -469,6 +483,7 @@ class PageViewAdmin(admin.ModelAdmin):
             ], ensure_ascii=False),
             'chart_month_labels': json.dumps(chart_month_labels),
             'chart_month_views':  json.dumps(chart_month_views),
+            'chart_month_visitors': json.dumps(chart_month_visitors),
             # Serializar listas para Chart.js
             'chart_days_labels': json.dumps(stats['chart_days_labels']),
             'chart_portfolio':   json.dumps(stats['chart_portfolio']),
@@ -499,6 +514,19 @@ class PageViewMonthlyAdmin(admin.ModelAdmin):
     list_display = ('page', 'year', 'month', 'total_views', 'unique_visitors')
     list_filter  = ('page', 'year')
     ordering     = ('-year', '-month')
+    exclude      = ('visitors',)
+
+    def has_add_permission(self, request):    return False
+    def has_change_permission(self, request, obj=None): return False
+
+
+@admin.register(PageViewDaily)
+class PageViewDailyAdmin(admin.ModelAdmin):
+    list_display = ('day', 'page', 'referrer', 'views')
+    list_filter  = ('page',)
+    ordering     = ('-day', 'page')
+    date_hierarchy = 'day'
+    exclude      = ('visitors',)
 
     def has_add_permission(self, request):    return False
     def has_change_permission(self, request, obj=None): return False
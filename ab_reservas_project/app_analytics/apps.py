@@ -1,7 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AppAnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_analytics'
     verbose_name = 'Analytics'
+
+    def ready(self):
+        from .partitions import create_on_migrate
+        post_migrate.connect(create_on_migrate, sender=self)
@@ -0,0 +1,276 @@
+"""
+Archivo columnar de las PageView crudas que borra cleanup_pageviews.
+
+Antes de soltar una partición o borrar un lote, el comando escribe sus filas
+en PAGEVIEW_ARCHIVE_DIR: un archivo por mes local y rango de ids,
+AAAA-MM/<primer id>-<último id>.pva. Así el detalle por visita (hora, página y
+referrer de cada visitante) sigue disponible sin ocupar la tabla.
+
+Formato .pva (little-endian):
+  b'ABPV' + versión (1 byte) + largo del encabezado (uint32) + encabezado JSON
+  + una columna tras otra, cada una comprimida con zlib por separado.
+
+El encabezado tiene la cantidad de filas, dónde está cada columna y los
+diccionarios de page y referrer. Las columnas:
+  id                         int64
+  timestamp                  int64, microsegundos desde 1970-01-01 UTC
+  page, referrer             uint32, posición en el diccionario
+  ip_hash, user_agent_hash   32 bytes: el SHA-256 en binario (ceros si vacío)
+
+Lectura:
+    from app_analytics import archive
+    for visit in archive.read_month(2025, 3):
+        visit.timestamp, visit.page, visit.ip_hash
+
+    with archive.Archive(path) as a:   # mmap; solo descomprime lo que se pide
+        a.column('timestamp')
+"""
+import json
+import mmap
+import os
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from ab_reservas_project.localtime import ASUNCION
+
+MAGIC = b'ABPV'
+VERSION = 1
+SUFFIX = '.pva'
+
+# Orden de las filas que recibe Writer.add(): sirve tal cual para values_list().
+FIELDS = ('pk', 'page', 'timestamp', 'ip_hash', 'referrer', 'user_agent_hash')
+COLUMNS = ('id', 'timestamp', 'page', 'referrer', 'ip_hash', 'user_agent_hash')
+
+Visit = namedtuple('Visit', COLUMNS)
+
+_HASH_SIZE = 32
+_NO_HASH = bytes(_HASH_SIZE)
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_INT = 'q'
+_CODE = 'I'
+
+
+def archive_dir():
+    """Carpeta del archivo, o None si PAGEVIEW_ARCHIVE_DIR está vacío (archivado apagado)."""
+    path = getattr(settings, 'PAGEVIEW_ARCHIVE_DIR', '')
+    return Path(path) if path else None
+
+
+def _to_le(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class _Month:
+    """Columnas de un mes mientras se van agregando filas."""
+
+    def __init__(self):
+        self.ids = array(_INT)
+        self.stamps = array(_INT)
+        self.pages = array(_CODE)
+        self.referrers = array(_CODE)
+        self.ip_hashes = bytearray()
+        self.ua_hashes = bytearray()
+        self.page_values = {}
+        self.referrer_values = {}
+
+    def add(self, pk, page, timestamp, ip_hash, referrer, user_agent_hash):
+        self.ids.append(pk)
+        self.stamps.append((timestamp - _EPOCH) // _MICROSECOND)
+        self.pages.append(self.page_values.setdefault(page, len(self.page_values)))
+        self.referrers.append(self.referrer_values.setdefault(referrer, len(self.referrer_values)))
+        self.ip_hashes += bytes.fromhex(ip_hash) if ip_hash else _NO_HASH
+        self.ua_hashes += bytes.fromhex(user_agent_hash) if user_agent_hash else _NO_HASH
+
+    def to_bytes(self):
+        blocks = [
+            ('id', _to_le(self.ids)),
+            ('timestamp', _to_le(self.stamps)),
+            ('page', _to_le(self.pages)),
+            ('referrer', _to_le(self.referrers)),
+            ('ip_hash', bytes(self.ip_hashes)),
+            ('user_agent_hash', bytes(self.ua_hashes)),
+        ]
+        columns, data, offset = {}, [], 0
+        for name, raw in blocks:
+            packed = zlib.compress(raw, 9)
+            columns[name] = [offset, len(packed)]
+            data.append(packed)
+            offset += len(packed)
+        header = json.dumps({
+            'rows': len(self.ids),
+            'columns': columns,
+            'page': list(self.page_values),
+            'referrer': list(self.referrer_values),
+        }).encode()
+        return b''.join([MAGIC, bytes([VERSION]), len(header).to_bytes(4, 'little'), header, *data])
+
+
+class Writer:
+    """
+    Junta filas (en el orden de FIELDS) y save() escribe un archivo por mes.
+
+    El nombre sale del mes y del rango de ids, así que volver a archivar las
+    mismas filas (una corrida cortada antes del commit) reescribe el mismo
+    archivo. Se escribe a un .tmp y se renombra: nunca queda uno a medias.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else archive_dir()
+        self.months = {}
+
+    def add(self, row):
+        local = row[2].astimezone(ASUNCION)
+        month = self.months.get((local.year, local.month))
+        if month is None:
+            month = self.months[(local.year, local.month)] = _Month()
+        month.add(*row)
+
+    def save(self):
+        """Escribe los meses juntados y devuelve las rutas. Sin carpeta configurada no hace nada."""
+        if self.directory is None:
+            return []
+        paths = []
+        for (year, month), columns in sorted(self.months.items()):
+            folder = self.directory / f'{year:04d}-{month:02d}'
+            folder.mkdir(parents=True, exist_ok=True)
+            path = folder / f'{min(columns.ids)}-{max(columns.ids)}{SUFFIX}'
+            tmp = path.with_name(path.name + '.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(columns.to_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            paths.append(path)
+        return paths
+
+
+class Archive:
+    """
+    Un archivo .pva abierto con mmap. column() descomprime solo esa columna;
+    iterar da una Visit por fila.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != MAGIC:
+            self.close()
+            raise ValueError(f'{self.path} no es un archivo de visitas')
+        if self._map[4] != VERSION:
+            self.close()
+            raise ValueError(f'{self.path}: versión {self._map[4]} no soportada')
+        size = int.from_bytes(self._map[5:9], 'little')
+        header = json.loads(self._map[9:9 + size])
+        self._data = 9 + size
+        self._columns = header['columns']
+        self.rows = header['rows']
+        self.pages = header['page']
+        self.referrers = header['referrer']
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def _raw(self, name):
+        offset, length = self._columns[name]
+        start = self._data + offset
+        return zlib.decompress(self._map[start:start + length])
+
+    def column(self, name):
+        """
+        Una columna entera: ids y timestamps (microsegundos UTC) como array de
+        int64, page/referrer como códigos del diccionario (self.pages,
+        self.referrers) y los hashes como bytes de 32 por fila.
+        """
+        if name not in COLUMNS:
+            raise KeyError(name)
+        if name in ('id', 'timestamp'):
+            return _from_le(_INT, self._raw(name))
+        if name in ('page', 'referrer'):
+            return _from_le(_CODE, self._raw(name))
+        return self._raw(name)
+
+    def __iter__(self):
+        ids = self.column('id')
+        stamps = self.column('timestamp')
+        pages = self.column('page')
+        referrers = self.column('referrer')
+        ip_hashes = self.column('ip_hash')
+        ua_hashes = self.column('user_agent_hash')
+        for i in range(self.rows):
+            ip = ip_hashes[i * _HASH_SIZE:(i + 1) * _HASH_SIZE]
+            ua = ua_hashes[i * _HASH_SIZE:(i + 1) * _HASH_SIZE]
+            yield Visit(
+                ids[i],
+                _EPOCH + stamps[i] * _MICROSECOND,
+                self.pages[pages[i]],
+                self.referrers[referrers[i]],
+                ip.hex() if ip != _NO_HASH else '',
+                ua.hex() if ua != _NO_HASH else '',
+            )
+
+
+def months(directory=None):
+    """Meses archivados, [(año, mes)] del más viejo al más nuevo."""
+    directory = directory if directory is not None else archive_dir()
+    if directory is None or not directory.is_dir():
+        return []
+    result = []
+    for folder in directory.iterdir():
+        year, _, month = folder.name.partition('-')
+        if folder.is_dir() and year.isdigit() and month.isdigit():
+            result.append((int(year), int(month)))
+    return sorted(result)
+
+
+def month_files(year, month, directory=None):
+    """Archivos de un mes, ordenados por el primer id."""
+    directory = directory if directory is not None else archive_dir()
+    if directory is None:
+        return []
+    folder = directory / f'{year:04d}-{month:02d}'
+    if not folder.is_dir():
+        return []
+    return sorted(folder.glob(f'*{SUFFIX}'), key=lambda p: int(p.stem.partition('-')[0]))
+
+
+def read_month(year, month, directory=None):
+    """
+    Las visitas archivadas de un mes, archivo por archivo. Si una corrida se
+    cortó entre escribir el archivo y borrar las filas, y la siguiente armó
+    lotes distintos, una visita puede estar en dos archivos: sale una vez.
+    """
+    seen = set()
+    for path in month_files(year, month, directory):
+        with Archive(path) as archived:
+            for visit in archived:
+                if visit.id not in seen:
+                    seen.add(visit.id)
+                    yield visit
@@ -0,0 +1,162 @@
+"""
+Buffer de PageView: las visitas se escriben en lote, fuera del request.
+
+PageViewMiddleware y track_pageview solo arman el PageView y lo dejan en una
+cola en memoria; un hilo del proceso los junta y hace un bulk_create cada
+PAGEVIEW_BATCH_SIZE filas o cada PAGEVIEW_FLUSH_MS milisegundos, lo que pase
+primero. Así el request no paga un INSERT + commit por visita, ni en la
+conexión que está sirviendo la página. Cada lote se suma al agregado diario
+(rollup.py) en la misma transacción: o quedan las dos cosas o ninguna.
+
+La cola tiene tope (PAGEVIEW_QUEUE_MAX): si la base se atrasa y se llena, las
+visitas nuevas se descartan y se cuentan. Analytics nunca frena un request.
+
+Al apagarse el worker (atexit, que uvicorn alcanza con un SIGTERM normal) se
+escribe lo que quede. Lo que haya en la cola si el proceso muere de golpe se
+pierde; para analytics es aceptable.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+log = logging.getLogger(__name__)
+
+
+class PageViewBuffer:
+
+    def __init__(self, batch_size, flush_ms, max_size):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        # Protege dropped y _pending (encoladas que todavía no se escribieron,
+        # contando las del lote que el hilo está armando o escribiendo).
+        self._state = threading.Condition()
+        self._pending = 0
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, pageview):
+        """Encola un PageView sin guardar. Nunca bloquea: si no hay lugar, lo descarta."""
+        self._ensure_started()
+        with self._state:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(pageview)
+        except queue.Full:
+            with self._state:
+                self._pending -= 1
+                self.dropped += 1
+                self._state.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Escribe ya todo lo encolado (comandos, tests, apagado): vacía la cola y
+        espera el lote que el hilo tenga en curso. Con visitas entrando sin
+        parar no terminaría nunca; por eso espera como mucho `timeout`
+        segundos (por defecto, un ciclo del hilo más 5 s).
+        """
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                break
+            self._write(batch)
+        if timeout is None:
+            timeout = self.flush_seconds + 5
+        with self._state:
+            return self._state.wait_for(lambda: self._pending <= 0, timeout)
+
+    def _ensure_started(self):
+        # Por proceso: los workers de uvicorn no heredan el hilo del padre.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='pageview-buffer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _take(self, block=True):
+        """Hasta batch_size filas; espera como mucho flush_seconds desde la primera."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if not block:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = self.flush_seconds if deadline is None else deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        close_old_connections()
+        saved = 0
+        try:
+            saved = self._save(batch)
+        finally:
+            with self._state:
+                self.written += saved
+                self._pending -= len(batch)
+                dropped, self.dropped = self.dropped, 0
+                self._state.notify_all()
+        if dropped:
+            log.warning('Buffer de visitas lleno: %d visitas descartadas', dropped)
+
+    def _save(self, batch):
+        """Guarda el lote y lo suma al agregado diario. Devuelve cuántas filas guardó."""
+        from .models import PageView
+        from .partitions import ensure_current_month
+        from .rollup import record
+
+        try:
+            # Al cambiar el mes: las particiones que vienen (partitions.py).
+            # Si falla, las filas igual entran en la DEFAULT.
+            ensure_current_month()
+        except Exception:
+            log.exception('No se pudieron crear las particiones de visitas')
+        try:
+            with transaction.atomic():
+                PageView.objects.bulk_create(batch)
+                record(batch)
+        except Exception:
+            log.exception('No se pudieron guardar %d visitas', len(batch))
+            return 0
+        return len(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take()
+            if batch:
+                self._write(batch)
+        connection.close()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+
+pageviews = PageViewBuffer(
+    batch_size=settings.PAGEVIEW_BATCH_SIZE,
+    flush_ms=settings.PAGEVIEW_FLUSH_MS,
+    max_size=settings.PAGEVIEW_QUEUE_MAX,
+)
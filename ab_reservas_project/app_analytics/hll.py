@@ -0,0 +1,96 @@
+"""
+HyperLogLog: visitantes únicos sin guardar las IPs hasheadas.
+
+Un Sketch resume un conjunto de ip_hash en 4096 registros de un byte
+(precisión 12, error típico ~1,6%; con pocos visitantes la estimación es
+prácticamente exacta). Dos sketches se unen tomando el máximo registro a
+registro, así que la unión es exacta: los visitantes únicos de un mes son los
+de la unión de sus días, sin contar dos veces a nadie.
+
+Serialización (to_bytes / from_bytes):
+  b''                 sketch vacío
+  b'S' + (>HB)*       disperso: pares (registro, valor) distintos de cero
+  b'D' + zlib(regs)   denso: los 4096 registros comprimidos
+
+Un día con pocas visitas ocupa unos bytes; el denso, unos pocos KB.
+"""
+import hashlib
+import math
+import struct
+import zlib
+
+P = 12
+M = 1 << P
+_SUFFIX_BITS = 64 - P
+_SUFFIX_MASK = (1 << _SUFFIX_BITS) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / M)
+
+_PAIR = struct.Struct('>HB')
+# Hasta acá conviene la forma dispersa (3 bytes por registro usado).
+_SPARSE_MAX = M // 8
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class Sketch:
+
+    __slots__ = ('registers',)
+
+    def __init__(self, values=()):
+        self.registers = bytearray(M)
+        for value in values:
+            self.add(value)
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        sketch.merge_bytes(data)
+        return sketch
+
+    def add(self, value):
+        x = _hash64(value)
+        index = x >> _SUFFIX_BITS
+        rank = _SUFFIX_BITS - (x & _SUFFIX_MASK).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def merge_bytes(self, data):
+        """Une un sketch serializado, sin armar el objeto si es disperso."""
+        data = bytes(data or b'')
+        if not data:
+            return self
+        kind, body = data[:1], data[1:]
+        if kind == b'S':
+            registers = self.registers
+            for index, rank in _PAIR.iter_unpack(body):
+                if rank > registers[index]:
+                    registers[index] = rank
+        elif kind == b'D':
+            self.registers = bytearray(map(max, self.registers, zlib.decompress(body)))
+        else:
+            raise ValueError('Sketch con formato desconocido')
+        return self
+
+    def count(self):
+        zeros = self.registers.count(0)
+        if zeros == M:
+            return 0
+        estimate = _ALPHA * M * M / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * M and zeros:
+            # Rango chico: conteo lineal sobre los registros vacíos.
+            estimate = M * math.log(M / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        used = [(i, r) for i, r in enumerate(self.registers) if r]
+        if not used:
+            return b''
+        if len(used) <= _SPARSE_MAX:
+            return b'S' + b''.join(_PAIR.pack(i, r) for i, r in used)
+        return b'D' + zlib.compress(bytes(self.registers))
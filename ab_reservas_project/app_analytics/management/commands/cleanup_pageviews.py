@@ -2,22 +2,110 @@
 Management command: agrega PageViews de más de 90 días en PageViewMonthly
 y luego los elimina para mantener la tabla liviana.
 
+Trabaja por lotes de ids consecutivos (--batch-size). Cada lote se agrega al
+mes y se borra en su propia transacción: el commit es el checkpoint. Si se
+corta (Ctrl-C, --max-seconds, un deploy), lo ya commiteado quedó consolidado y
+borrado, y la próxima corrida sigue con las filas que quedan; nada se cuenta
+dos veces. Así un atraso grande no termina en un único DELETE gigante que
+retiene locks y llena el WAL.
+
+En PostgreSQL, con la tabla particionada por mes (app_analytics/partitions.py),
+la retención va por meses enteros: cada partición cuyo mes terminó antes del
+corte se consolida y se suelta (DETACH + DROP) en una transacción, sin borrar
+filas. Las visitas de un mes que vence a medias esperan a que venza entero.
+Las que cayeron en la DEFAULT (fuera de toda partición mensual) se borran por
+lotes hasta el corte, como en una tabla común. El comando también crea las
+particiones de los meses que vienen.
+
+Antes de borrar, las filas crudas se guardan en el archivo columnar
+(app_analytics/archive.py, PAGEVIEW_ARCHIVE_DIR): un archivo por mes y rango
+de ids, escrito antes del commit. Si la corrida se corta entre los dos, la
+siguiente vuelve a archivar esas filas y el lector no las repite.
+
+En PostgreSQL corre una sola instancia a la vez (advisory lock de sesión): dos
+corridas superpuestas, por ejemplo el cron y una manual, tomarían los mismos
+lotes y los sumarían dos veces al histórico. La segunda avisa y termina.
+
 Uso:
     python manage.py cleanup_pageviews
     python manage.py cleanup_pageviews --dry-run
+    python manage.py cleanup_pageviews --batch-size 2000 --max-seconds 300
 
 Cron recomendado (semanal los domingos a las 3 AM):
     0 3 * * 0 docker exec ab-django python manage.py cleanup_pageviews
 """
+import time
+from contextlib import contextmanager
+
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.db.models import Count
-from django.db.models.functions import TruncMonth
+from django.db import connection, transaction
 from django.utils import timezone
 from datetime import timedelta
 
+from ab_reservas_project.localtime import ASUNCION
+from app_analytics import archive, partitions
+from app_analytics.hll import Sketch
 from app_analytics.models import PageView, PageViewMonthly
 
+# Argumentos de pg_try_advisory_lock(int, int) mientras dura la corrida.
+LOCK_KEY = (0x434C4E50, 0)  # 'CLNP'
+
+
+@contextmanager
+def _single_run():
+    """True si esta corrida tiene el lock; en SQLite siempre."""
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', LOCK_KEY)
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', LOCK_KEY)
+
+
+def _aggregate(rows, writer=None):
+    """
+    {(página, año, mes local): [vistas, Sketch]} de filas en el orden de
+    archive.FIELDS. Con writer, además las junta para el archivo.
+    """
+    aggregated = {}
+    for row in rows:
+        if writer is not None:
+            writer.add(row)
+        _, page, timestamp, ip_hash = row[:4]
+        local = timestamp.astimezone(ASUNCION)
+        row = aggregated.setdefault((page, local.year, local.month), [0, Sketch()])
+        row[0] += 1
+        row[1].add(ip_hash)
+    return aggregated
+
+
+def _add_to_monthly(aggregated):
+    # El sketch se une con el que ya tenga el mes, así una IP que vuelve en
+    # otro lote u otra corrida no se cuenta dos veces.
+    for (page, year, month), (total, sketch) in sorted(aggregated.items()):
+        obj, _ = PageViewMonthly.objects.select_for_update().get_or_create(
+            page=page,
+            year=year,
+            month=month,
+            defaults={'total_views': 0, 'unique_visitors': 0},
+        )
+        # Un mes consolidado antes de los sketches solo tiene el número: al
+        # recibir su primer sketch ese número pasa a legacy_unique_visitors y
+        # de ahí en más se suma siempre.
+        if not obj.visitors:
+            obj.legacy_unique_visitors = obj.unique_visitors
+        sketch.merge_bytes(obj.visitors)
+        obj.total_views += total
+        obj.visitors = sketch.to_bytes()
+        obj.unique_visitors = obj.legacy_unique_visitors + sketch.count()
+        obj.save()
+
 
 class Command(BaseCommand):
     help = 'Agrega PageViews de más de 90 días en PageViewMonthly y los elimina'
@@ -28,58 +116,168 @@ class Command(BaseCommand):
             action='store_true',
             help='Muestra qué se haría sin ejecutar cambios',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Filas por lote (una transacción cada uno)',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=None,
+            help='Deja de tomar lotes nuevos pasado este tiempo; lo que falte queda para la próxima corrida',
+        )
 
     def handle(self, *args, **options):
+        if options['dry_run']:
+            self._cleanup(options)
+            return
+        with _single_run() as acquired:
+            if not acquired:
+                self.stdout.write(self.style.WARNING(
+                    'Ya hay otra limpieza corriendo; esta termina sin hacer nada.'
+                ))
+                return
+            self._cleanup(options)
+
+    def _cleanup(self, options):
         dry_run = options['dry_run']
+        batch_size = max(1, options['batch_size'])
+        max_seconds = options['max_seconds']
         cutoff = timezone.now() - timedelta(days=90)
+        self.started = time.monotonic()
+        self.deadline = self.started + max_seconds if max_seconds is not None else None
 
         old_views = PageView.objects.filter(timestamp__lt=cutoff)
+        dropped = 0
+        if partitions.is_partitioned():
+            if not dry_run:
+                for name in partitions.ensure_partitions():
+                    self.stdout.write(f'Partición creada: {name}')
+            expired = [p for p in partitions.partitions() if p[2] <= cutoff]
+            dropped, finished = self._drop_partitions(expired, batch_size, dry_run)
+            if not finished:
+                self._done(dropped)
+                return
+            # Lo que quede vencido fuera de las particiones mensuales (en la
+            # DEFAULT) se borra por lotes; el mes que vence a medias espera a
+            # vencer entero.
+            for name, lower, upper in partitions.partitions():
+                if lower < cutoff:
+                    old_views = old_views.exclude(timestamp__gte=lower, timestamp__lt=upper)
+
         total_old = old_views.count()
 
         if total_old == 0:
-            self.stdout.write('No hay registros con más de 90 días. Nada que hacer.')
+            if not dropped:
+                self.stdout.write('No hay registros con más de 90 días. Nada que hacer.')
+            elif not dry_run:
+                self._done(dropped)
             return
 
         self.stdout.write(f'Encontrados {total_old} registros con más de 90 días (hasta {cutoff:%Y-%m-%d}).')
 
-        # Agregar por página, año y mes
-        aggregated = (
-            old_views
-            .annotate(month_trunc=TruncMonth('timestamp'))
-            .values('page', 'month_trunc')
-            .annotate(
-                total=Count('id'),
-                unique=Count('ip_hash', distinct=True),
-            )
-        )
-
         if dry_run:
+            raw = old_views.values_list(*archive.FIELDS)
+            aggregated = _aggregate(raw.iterator(chunk_size=2000))
             self.stdout.write('[DRY RUN] Se agregarían los siguientes datos:')
-            for row in aggregated:
+            for (page, year, month), (total, sketch) in sorted(aggregated.items()):
                 self.stdout.write(
-                    f"  {row['page']} — {row['month_trunc']:%Y/%m}: "
-                    f"{row['total']} vistas, {row['unique']} IPs únicas"
+                    f"  {page} — {year}/{month:02d}: "
+                    f"{total} vistas, ~{sketch.count()} IPs únicas"
                 )
-            self.stdout.write(f'[DRY RUN] Se eliminarían {total_old} registros.')
+            self.stdout.write(
+                f'[DRY RUN] Se eliminarían {total_old} registros '
+                f'en {-(-total_old // batch_size)} lotes de hasta {batch_size}.'
+            )
             return
 
-        with transaction.atomic():
-            for row in aggregated:
-                dt = row['month_trunc']
-                obj, _ = PageViewMonthly.objects.get_or_create(
-                    page=row['page'],
-                    year=dt.year,
-                    month=dt.month,
-                    defaults={'total_views': 0, 'unique_visitors': 0},
-                )
-                obj.total_views += row['total']
-                obj.unique_visitors += row['unique']
-                obj.save()
+        deleted_count = 0
+        last_pk = 0
+        while True:
+            if self._out_of_time():
+                self.stdout.write(self.style.WARNING(
+                    f'Corte por --max-seconds: quedan {total_old - deleted_count} registros '
+                    f'para la próxima corrida.'
+                ))
+                break
+
+            batch = list(
+                old_views.filter(pk__gt=last_pk).order_by('pk')
+                .values_list(*archive.FIELDS)[:batch_size]
+            )
+            if not batch:
+                break
+            first_pk, last_pk = batch[0][0], batch[-1][0]
+
+            writer = archive.Writer()
+            aggregated = _aggregate(batch, writer)
+            archived = writer.save()
+            with transaction.atomic():
+                _add_to_monthly(aggregated)
+                deleted, _ = old_views.filter(pk__gte=first_pk, pk__lte=last_pk).delete()
+            deleted_count += deleted
+
+            elapsed = time.monotonic() - self.started
+            self.stdout.write(
+                f'  lote ids {first_pk}–{last_pk}: {deleted} eliminados{self._archived(archived)} '
+                f'({deleted_count}/{total_old}, {(dropped + deleted_count) / elapsed:,.0f} filas/s)'
+            )
+
+        self._done(dropped + deleted_count)
+
+    def _out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _drop_partitions(self, expired, batch_size, dry_run):
+        """
+        Consolida y suelta las particiones mensuales vencidas, una transacción
+        por partición. Devuelve (filas eliminadas, si terminó).
+        """
+        total = 0
+        for name, lower, upper in expired:
+            if self._out_of_time():
+                self.stdout.write(self.style.WARNING(
+                    'Corte por --max-seconds: quedan particiones vencidas para la próxima corrida.'
+                ))
+                return total, False
+
+            raw = PageView.objects.filter(
+                timestamp__gte=lower, timestamp__lt=upper,
+            ).values_list(*archive.FIELDS)
+            writer = None if dry_run else archive.Writer()
+            aggregated = _aggregate(raw.iterator(chunk_size=batch_size), writer)
+            rows = sum(views for views, _ in aggregated.values())
+
+            if dry_run:
+                self.stdout.write(f'[DRY RUN] Se consolidaría y eliminaría la partición {name}: {rows} vistas.')
+                continue
+
+            archived = writer.save()
+            with transaction.atomic():
+                _add_to_monthly(aggregated)
+                partitions.drop_partition(name)
+            total += rows
+
+            elapsed = time.monotonic() - self.started
+            self.stdout.write(
+                f'  partición {name}: {rows} vistas consolidadas y eliminadas{self._archived(archived)} '
+                f'({total / elapsed:,.0f} filas/s)'
+            )
+        return total, True
 
-            deleted_count, _ = old_views.delete()
+    def _archived(self, paths):
+        if not paths:
+            return ''
+        return ', archivo ' + ', '.join(f'{p.parent.name}/{p.name}' for p in paths)
 
+    def _done(self, deleted_count):
+        elapsed = time.monotonic() - self.started
+        rate = deleted_count / elapsed if elapsed else 0
         self.stdout.write(
             self.style.SUCCESS(
-                f'Listo: {deleted_count} registros eliminados, datos agregados a histórico mensual.'
+                f'Listo: {deleted_count} registros eliminados en {elapsed:.1f} s ({rate:,.0f} filas/s), '
+                f'datos agregados a histórico mensual.'
             )
         )
@@ -0,0 +1,92 @@
+"""
+Management command: planes de las consultas por día de analytics y reservas.
+
+Para cada consulta muestra el plan con el filtro viejo (`campo__date`, que
+convierte cada fila antes de comparar) y con el rango de localtime.day_filter(),
+que usa el índice de la columna. En PostgreSQL sale EXPLAIN (con --analyze,
+EXPLAIN ANALYZE); en SQLite, EXPLAIN QUERY PLAN.
+
+sql/explain_analytics_postgresql.txt es la salida con --analyze contra
+PostgreSQL 16, con 800 mil visitas en orden de llegada a lo largo de 88 días
+y las reservas del seed. Con el rango, las vistas de hoy leen solo la
+partición del mes por su B-tree, y las del período solo las dos particiones
+que toca, por el BRIN (<partición>_timestamp_idx1, bloques "lossy"). Con
+__date se recorren todas. Las tablas de reservas del seed son chicas y ahí el
+seq scan es lo que corresponde. La de producción se saca con:
+    docker exec ab-django python manage.py explain_analytics --analyze
+
+Uso:
+    python manage.py explain_analytics
+    python manage.py explain_analytics --days 30
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from ab_reservas_project.localtime import day_filter, local_day
+from app_analytics.models import PageView
+
+
+class Command(BaseCommand):
+    help = 'Muestra los planes de las consultas por día: filtro __date contra rango'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Largo del período de las consultas de rango (por defecto 30)',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='En PostgreSQL, ejecuta las consultas (EXPLAIN ANALYZE)',
+        )
+
+    def handle(self, *args, **options):
+        from app_fractalia.models import Booking, PendingBooking
+
+        today = local_day(timezone.now())
+        start = today - timedelta(days=max(1, options['days']) - 1)
+        explain = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain = {'analyze': True, 'buffers': True}
+
+        cases = [
+            (
+                'Vistas de hoy (visit_rows)',
+                PageView.objects.filter(timestamp__date=today),
+                PageView.objects.filter(**day_filter('timestamp', today, today)),
+            ),
+            (
+                f'Vistas del período (rebuild, {start} a {today})',
+                PageView.objects.filter(timestamp__date__gte=start, timestamp__date__lte=today),
+                PageView.objects.filter(**day_filter('timestamp', start, today)),
+            ),
+            (
+                'Pre-reservas del período (_build_stats)',
+                PendingBooking.objects.filter(created_at__date__gte=start),
+                PendingBooking.objects.filter(**day_filter('created_at', start)),
+            ),
+            (
+                'Pre-reservas de un día (resumen_del_dia)',
+                PendingBooking.objects.filter(created_at__date=today),
+                PendingBooking.objects.filter(**day_filter('created_at', today, today)),
+            ),
+            (
+                'Reservas de hoy (resumen_del_dia)',
+                Booking.objects.filter(status='CONFIRMED', start_datetime__date=today),
+                Booking.objects.filter(status='CONFIRMED', **day_filter('start_datetime', today, today)),
+            ),
+        ]
+
+        self.stdout.write(f'Motor: {connection.vendor}')
+        for title, old, new in cases:
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(f'── {title}'))
+            for label, qs in (('__date', old), ('rango', new)):
+                qs = qs.order_by().values('pk')
+                self.stdout.write(f'[{label}] {qs.query}')
+                self.stdout.write(qs.explain(**explain))
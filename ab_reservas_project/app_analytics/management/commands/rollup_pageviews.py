@@ -0,0 +1,45 @@
+"""
+Management command: recalcula PageViewDaily desde las PageView crudas.
+
+El agregado diario se mantiene solo al guardar cada lote de visitas; este
+comando es para rehacerlo si algo quedó a medias (un lote que falló, un seed
+cargado a mano). Solo toca días cerrados que todavía tienen todas sus filas
+crudas: los anteriores a la retención de cleanup_pageviews se dejan como
+están, y hoy también (el dashboard lo lee de las filas crudas y el buffer lo
+sigue sumando).
+
+Uso:
+    python manage.py rollup_pageviews            # los 7 días anteriores a hoy
+    python manage.py rollup_pageviews --days 89
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ab_reservas_project.localtime import local_day
+from app_analytics.rollup import rebuild
+
+# Días completos que conservan filas crudas (cleanup_pageviews borra a los 90).
+RAW_DAYS = 89
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el agregado diario de visitas desde las PageView crudas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help=f'Cuántos días hacia atrás, sin contar hoy (máximo {RAW_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        days = max(1, min(options['days'], RAW_DAYS))
+        end = local_day(timezone.now()) - timedelta(days=1)
+        start = end - timedelta(days=days - 1)
+        views = rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'Listo: {days} días recalculados ({start:%Y-%m-%d} a {end:%Y-%m-%d}), {views} vistas.'
+        ))
@@ -1,3 +1,11 @@
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils import timezone
+
+from app_fractalia.ratelimit import client_ip
+
+from .buffer import pageviews
 from .models import PageView, VALID_PAGE_KEYS
 
 # Mapeo de paths Django → identificador de página
@@ -14,42 +22,74 @@ class PageViewMiddleware:
     """
     Registra automáticamente visitas a páginas Django renderizadas por el servidor.
     Las páginas React se trackean mediante el endpoint /api/analytics/track/.
+
+    Funciona en los dos modos: bajo ASGI no saca del loop a las vistas async.
+    Antes de devolver la respuesta solo decide si la visita se trackea; el hash
+    de la IP, el dominio del referrer y el encolado en el buffer (buffer.py)
+    corren recién cuando el servidor cierra la respuesta, ya enviada al
+    cliente. Así el TTFB de la página no incluye nada de analytics.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         response = self.get_response(request)
+        self._record_after(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self._record_after(request, response)
+        return response
 
+    def _record_after(self, request, response):
+        try:
+            page = self._tracked_page(request, response)
+            if page:
+                record = partial(
+                    self._record, page, client_ip(request),
+                    request.META.get('HTTP_REFERER', ''), timezone.now(),
+                )
+                # response.close() corre los closers cuando el servidor terminó
+                # de mandar el cuerpo: ASGIHandler lo llama después de
+                # send_response, y un servidor WSGI al terminar de iterarlo.
+                # _resource_closers es interno de Django: si una versión lo
+                # cambia, la visita se encola acá mismo en vez de perderse.
+                closers = getattr(response, '_resource_closers', None)
+                if isinstance(closers, list):
+                    closers.append(record)
+                else:
+                    record()
+        except Exception:
+            pass  # analytics nunca rompe la request
+
+    @staticmethod
+    def _tracked_page(request, response):
+        """Página a registrar, o None si la request no se trackea."""
         # Solo GET exitosos
         if request.method != 'GET' or response.status_code >= 400:
-            return response
+            return None
 
         path = request.path_info
         if any(path.startswith(p) for p in SKIP_PREFIXES):
-            return response
+            return None
 
-        page = PAGE_MAP.get(path)
-        if not page:
-            return response
-
-        try:
-            ip = self._get_ip(request)
-            referrer_url = request.META.get('HTTP_REFERER', '')
-            PageView.objects.create(
-                page=page,
-                ip_hash=PageView.hash_ip(ip),
-                referrer=PageView.extract_referrer_domain(referrer_url),
-            )
-        except Exception:
-            pass  # analytics nunca rompe la request
-
-        return response
+        return PAGE_MAP.get(path)
 
     @staticmethod
-    def _get_ip(request) -> str:
-        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
-        if forwarded:
-            return forwarded.split(',')[0].strip()
-        return request.META.get('REMOTE_ADDR', '0.0.0.0')
+    def _record(page, ip, referrer_url, timestamp):
+        pageviews.add(PageView(
+            page=page,
+            timestamp=timestamp,
+            ip_hash=PageView.hash_ip(ip),
+            referrer=PageView.extract_referrer_domain(referrer_url),
+        ))
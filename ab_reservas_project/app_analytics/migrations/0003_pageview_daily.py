@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:57
+"""
+PageViewDaily: agregado diario de visitas (app_analytics/rollup.py).
+
+Completa la tabla con las PageView que ya existen; desde acá la mantiene
+al día el buffer de visitas.
+"""
+import zoneinfo
+
+from django.db import migrations, models
+
+from app_analytics.hll import Sketch
+
+ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
+
+
+def fill_daily(apps, schema_editor):
+    PageView = apps.get_model('app_analytics', 'PageView')
+    PageViewDaily = apps.get_model('app_analytics', 'PageViewDaily')
+
+    groups = {}
+    raw = PageView.objects.values_list('timestamp', 'page', 'referrer', 'ip_hash')
+    for timestamp, page, referrer, ip_hash in raw.iterator(chunk_size=2000):
+        key = (timestamp.astimezone(ASUNCION).date(), page, referrer)
+        group = groups.setdefault(key, [0, Sketch()])
+        group[0] += 1
+        group[1].add(ip_hash)
+    PageViewDaily.objects.bulk_create([
+        PageViewDaily(day=day, page=page, referrer=referrer, views=views, visitors=sketch.to_bytes())
+        for (day, page, referrer), (views, sketch) in groups.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_analytics', '0002_rename_app_analyti_page_ts_idx_app_analyti_page_6ab01e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('page', models.CharField(choices=[('portfolio', 'Portfolio (React)'), ('links', 'Links'), ('fractalia_calendar', 'Calendario Fractalia'), ('fractalia_booking', 'Formulario de reserva'), ('fractalia_confirmation', 'Confirmación de reserva')], max_length=50, verbose_name='Página')),
+                ('referrer', models.CharField(blank=True, default='', max_length=100, verbose_name='Referrer')),
+                ('views', models.IntegerField(default=0, verbose_name='Vistas')),
+                ('visitors', models.BinaryField(default=b'', verbose_name='Visitantes (sketch)')),
+            ],
+            options={
+                'verbose_name': 'Vista diaria agregada',
+                'verbose_name_plural': 'Vistas diarias agregadas',
+                'ordering': ['-day'],
+                'unique_together': {('day', 'page', 'referrer')},
+            },
+        ),
+        migrations.RunPython(fill_daily, migrations.RunPython.noop),
+    ]
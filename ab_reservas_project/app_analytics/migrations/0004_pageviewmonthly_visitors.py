@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_analytics', '0003_pageview_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageviewmonthly',
+            name='visitors',
+            field=models.BinaryField(default=b'', verbose_name='Visitantes (sketch)'),
+        ),
+    ]
@@ -0,0 +1,125 @@
+"""
+app_analytics_pageview particionada por mes (solo PostgreSQL).
+
+Rehace la tabla como PARTITION BY RANGE ("timestamp"), con una partición por
+mes local (America/Asuncion) desde el mes de la visita más vieja hasta
+MONTHS_AHEAD meses adelante, y una DEFAULT de resguardo. Copia las filas,
+vuelve a crear los índices con los mismos nombres y deja el id con una
+secuencia propia. La clave primaria pasa a (id, timestamp): PostgreSQL exige
+que incluya la columna de partición; para Django el id sigue siendo la clave.
+La vuelta atrás deja la tabla común con el id como identity, igual que la
+creó Django, así la migración se puede volver a aplicar.
+
+Desde acá las particiones nuevas las crea app_analytics/partitions.py. En
+SQLite la migración no hace nada.
+"""
+from datetime import date, datetime, time
+import zoneinfo
+
+from django.db import migrations
+
+ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
+
+TABLE = 'app_analytics_pageview'
+OLD = f'{TABLE}_old'
+SEQUENCE = f'{TABLE}_id_seq'
+COLUMNS = 'id, page, "timestamp", ip_hash, referrer, user_agent_hash'
+MONTHS_AHEAD = 3
+
+
+def _month_start(year, month):
+    return datetime.combine(date(year, month, 1), time.min, tzinfo=ASUNCION)
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _index_defs(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s',
+            [table, f'{table}_pkey'],
+        )
+        # Los de la tabla particionada salen como "ON ONLY tabla"; se
+        # recrean sin ONLY, sobre la tabla común.
+        return [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+
+
+def partition_pageview(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    run = schema_editor.execute
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("timestamp"), now() FROM {TABLE}')
+        oldest, now = cursor.fetchone()
+    index_defs = _index_defs(schema_editor, TABLE)
+
+    run(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD}_pkey')
+    run(f'ALTER TABLE {TABLE} RENAME TO {OLD}')
+    run(
+        f'CREATE TABLE {TABLE} (LIKE {OLD} INCLUDING DEFAULTS, PRIMARY KEY (id, "timestamp")) '
+        f'PARTITION BY RANGE ("timestamp")'
+    )
+    # Si el id de la vieja tenía un nextval() de default (no identity), no se
+    # hereda: la secuencia se va con la tabla vieja y se crea otra abajo.
+    run(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+
+    first = (oldest or now).astimezone(ASUNCION)
+    last = now.astimezone(ASUNCION)
+    year, month = first.year, first.month
+    end = (last.year, last.month)
+    for _ in range(MONTHS_AHEAD):
+        end = _next_month(*end)
+    while (year, month) <= end:
+        lower, upper = _month_start(year, month), _month_start(*_next_month(year, month))
+        run(
+            f'CREATE TABLE {TABLE}_p{year:04d}_{month:02d} PARTITION OF {TABLE} '
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        year, month = _next_month(year, month)
+    run(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    run(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {OLD}')
+    # Borra también la secuencia de la identidad vieja; se reemplaza abajo.
+    run(f'DROP TABLE {OLD}')
+
+    run(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    run(f"SELECT setval('{SEQUENCE}', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)")
+    run(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+
+    for index_def in index_defs:
+        run(index_def)
+
+
+def unpartition_pageview(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    run = schema_editor.execute
+    index_defs = _index_defs(schema_editor, TABLE)
+
+    run(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD}_pkey')
+    run(f'ALTER TABLE {TABLE} RENAME TO {OLD}')
+    run(f'CREATE TABLE {TABLE} (LIKE {OLD}, PRIMARY KEY (id))')
+    run(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {OLD}')
+    # Se lleva la secuencia propia (OWNED BY); el id vuelve a ser identity.
+    run(f'DROP TABLE {OLD}')
+    run(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    run(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+    )
+    for index_def in index_defs:
+        run(index_def)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_analytics', '0004_pageviewmonthly_visitors'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_pageview, unpartition_pageview),
+    ]
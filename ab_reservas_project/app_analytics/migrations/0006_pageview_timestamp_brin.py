@@ -0,0 +1,39 @@
+"""
+Índice BRIN sobre app_analytics_pageview.timestamp (solo PostgreSQL).
+
+Las visitas se insertan en orden de llegada, así que el timestamp crece junto
+con el orden físico de la tabla: un BRIN guarda el rango de cada bloque de
+páginas y ocupa unos pocos KB, contra los MB del B-tree. Sirve a los filtros
+por rango de días (ab_reservas_project/localtime.py) dentro de cada partición.
+
+El B-tree de timestamp se queda: el listado del admin ordena por timestamp y
+eso un BRIN no lo resuelve. Sobre la tabla particionada, el índice se crea en
+cada partición y en las que se creen después. En SQLite no hace nada.
+"""
+from django.db import migrations
+
+TABLE = 'app_analytics_pageview'
+INDEX = f'{TABLE}_ts_brin'
+
+
+def create_brin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX} ON {TABLE} USING brin ("timestamp")')
+
+
+def drop_brin(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_analytics', '0005_pageview_partitions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_brin, drop_brin),
+    ]
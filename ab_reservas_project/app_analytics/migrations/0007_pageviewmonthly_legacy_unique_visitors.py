@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:40
+"""
+PageViewMonthly.legacy_unique_visitors: los visitantes únicos que un mes ya
+tenía consolidados antes de los sketches, aparte del sketch.
+
+Meses sin sketch: el número es todo legado. Meses que ya recibieron un sketch:
+cleanup_pageviews guardó legado + sketch.count(), así que el legado es la
+diferencia (si una segunda corrida ya lo pisó, da 0 y no hay nada que
+recuperar).
+"""
+from django.db import migrations, models
+
+from app_analytics.hll import Sketch
+
+
+def fill_legacy(apps, schema_editor):
+    PageViewMonthly = apps.get_model('app_analytics', 'PageViewMonthly')
+    for month in PageViewMonthly.objects.all():
+        sketched = Sketch.from_bytes(month.visitors).count() if month.visitors else 0
+        month.legacy_unique_visitors = max(0, month.unique_visitors - sketched)
+        month.save(update_fields=['legacy_unique_visitors'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_analytics', '0006_pageview_timestamp_brin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageviewmonthly',
+            name='legacy_unique_visitors',
+            field=models.IntegerField(default=0, verbose_name='Visitantes únicos sin sketch'),
+        ),
+        migrations.RunPython(fill_legacy, migrations.RunPython.noop),
+    ]
@@ -18,6 +18,7 @@ class PageView(models.Model):
     """
     Registro individual de cada visita a una página.
     Se mantienen 90 días; luego se agregan a PageViewMonthly y se eliminan.
+    En PostgreSQL la tabla está particionada por mes (partitions.py).
     """
     page = models.CharField(
         max_length=50,
@@ -86,6 +87,13 @@ class PageViewMonthly(models.Model):
     """
     Agregado mensual: se crea cuando los PageView superan los 90 días.
     Permite ver tendencias históricas sin mantener millones de filas.
+
+    visitors es un sketch HyperLogLog (hll.py) de las IPs del mes: cada corrida
+    de cleanup_pageviews lo une con el suyo, así un visitante que vuelve en
+    otra semana no se cuenta dos veces, y varios meses se unen igual
+    (rollup.monthly_unique_visitors). legacy_unique_visitors es lo que el mes
+    ya tenía contado antes de los sketches (se fija una vez, al agregarle el
+    primero) y unique_visitors guarda legado + estimación.
     """
     page = models.CharField(
         max_length=50,
@@ -96,6 +104,8 @@ class PageViewMonthly(models.Model):
     month = models.IntegerField(verbose_name='Mes')
     total_views = models.IntegerField(default=0, verbose_name='Total vistas')
     unique_visitors = models.IntegerField(default=0, verbose_name='Visitantes únicos (IPs únicas)')
+    visitors = models.BinaryField(default=b'', verbose_name='Visitantes (sketch)')
+    legacy_unique_visitors = models.IntegerField(default=0, verbose_name='Visitantes únicos sin sketch')
 
     class Meta:
         verbose_name = 'Vista mensual agregada'
@@ -106,3 +116,38 @@ class PageViewMonthly(models.Model):
     def __str__(self):
         page_label = dict(VALID_PAGES).get(self.page, self.page)
         return f'{page_label} — {self.year}/{self.month:02d}: {self.total_views} vistas'
+
+
+class PageViewDaily(models.Model):
+    """
+    Agregado diario: vistas por día local (America/Asuncion), página y dominio
+    de origen, con un sketch HyperLogLog de visitantes (hll.py) que se puede
+    unir entre días sin contar dos veces a nadie.
+
+    Se actualiza al guardar cada lote de visitas (rollup.py); los tableros y
+    el MCP lo leen para los días ya cerrados y van a PageView solo para hoy.
+    """
+    day = models.DateField(verbose_name='Día')
+    page = models.CharField(
+        max_length=50,
+        choices=VALID_PAGES,
+        verbose_name='Página',
+    )
+    referrer = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Referrer',
+    )
+    views = models.IntegerField(default=0, verbose_name='Vistas')
+    visitors = models.BinaryField(default=b'', verbose_name='Visitantes (sketch)')
+
+    class Meta:
+        verbose_name = 'Vista diaria agregada'
+        verbose_name_plural = 'Vistas diarias agregadas'
+        unique_together = ('day', 'page', 'referrer')
+        ordering = ['-day']
+
+    def __str__(self):
+        page_label = dict(VALID_PAGES).get(self.page, self.page)
+        return f'{page_label} — {self.day:%Y-%m-%d} ({self.referrer or "directo"}): {self.views} vistas'
@@ -0,0 +1,167 @@
+"""
+Particiones mensuales de app_analytics_pageview (solo PostgreSQL).
+
+La migración 0005 convierte la tabla en particionada por rango de timestamp:
+una partición por mes local (America/Asuncion), app_analytics_pageview_pAAAA_MM,
+más una DEFAULT que solo debería recibir filas fuera de todo rango. Las
+consultas con timestamp acotado (>= / <) solo leen las particiones del rango.
+
+ensure_partitions() crea las de los próximos meses. No depende de un solo
+cron: corre después de cada migrate (post_migrate; el entrypoint migra en cada
+arranque), en el hilo del buffer una vez por mes y proceso
+(ensure_current_month) y en cleanup_pageviews, que además suelta las
+particiones vencidas enteras (drop_partition) en vez de borrar fila por fila.
+
+Si igual llegaron a la DEFAULT filas de un mes antes de que existiera su
+partición, create_partition() las pasa a la nueva: PostgreSQL no deja crear
+una partición cuyo rango tenga filas en la DEFAULT.
+
+En SQLite la tabla es común y todo esto no hace nada.
+"""
+import re
+from datetime import date, datetime, time
+
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils import timezone
+
+from ab_reservas_project.localtime import ASUNCION, local_day
+
+TABLE = 'app_analytics_pageview'
+DEFAULT_PARTITION = f'{TABLE}_default'
+# Meses creados por adelantado, además del actual.
+MONTHS_AHEAD = 3
+
+# Primer argumento de pg_advisory_xact_lock(int, int): dos procesos que crean
+# particiones a la vez (los workers, un migrate) no chocan.
+LOCK_NAMESPACE = 0x50415254  # 'PART'
+
+_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+_COLUMNS = 'id, page, "timestamp", ip_hash, referrer, user_agent_hash'
+# (año, mes) ya revisado por ensure_current_month() en este proceso.
+_checked_month = None
+
+
+def month_start(year, month):
+    """Primer instante del mes local, como datetime aware."""
+    return datetime.combine(date(year, month, 1), time.min, tzinfo=ASUNCION)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_name(year, month):
+    return f'{TABLE}_p{year:04d}_{month:02d}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions():
+    """
+    Particiones mensuales existentes, de la más vieja a la más nueva:
+    [(nombre, desde, hasta)] con el rango [desde, hasta) en hora local.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)', [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    result = []
+    for name in names:
+        match = _NAME.match(name)
+        if match:
+            year, month = int(match.group(1)), int(match.group(2))
+            result.append((name, month_start(year, month), month_start(*next_month(year, month))))
+    return sorted(result, key=lambda p: p[1])
+
+
+def create_partition(year, month):
+    """
+    Crea la partición del mes. Si la DEFAULT tiene filas de ese rango, la
+    separa, crea la partición, le pasa esas filas y la vuelve a adjuntar, todo
+    en una transacción. Devuelve cuántas filas movió.
+    """
+    name = partition_name(year, month)
+    lower = month_start(year, month)
+    upper = month_start(*next_month(year, month))
+    create = (
+        f'CREATE TABLE {name} PARTITION OF {TABLE} '
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+    in_range = 'WHERE "timestamp" >= %s AND "timestamp" < %s'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} {in_range})', [lower, upper],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(create)
+            return 0
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(create)
+        cursor.execute(
+            f'INSERT INTO {name} ({_COLUMNS}) SELECT {_COLUMNS} FROM {DEFAULT_PARTITION} {in_range}',
+            [lower, upper],
+        )
+        moved = cursor.rowcount
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} {in_range}', [lower, upper])
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+        return moved
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Particiones del mes actual y los `months_ahead` siguientes. Devuelve las creadas."""
+    if not is_partitioned():
+        return []
+    today = local_day(timezone.now())
+    created = []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, 0)', [LOCK_NAMESPACE])
+        # Se leen con el lock tomado: otro proceso pudo haberlas creado recién.
+        existing = {name for name, _, _ in partitions()}
+        year, month = today.year, today.month
+        for _ in range(months_ahead + 1):
+            if partition_name(year, month) not in existing:
+                create_partition(year, month)
+                created.append(partition_name(year, month))
+            year, month = next_month(year, month)
+    return created
+
+
+def ensure_current_month():
+    """
+    ensure_partitions() la primera vez que se llama en el proceso y después
+    una vez por mes local. Para el hilo del buffer: casi siempre no consulta
+    nada. Si falla no se reintenta hasta el mes siguiente; quedan el
+    post_migrate y el cron.
+    """
+    global _checked_month
+    today = local_day(timezone.now())
+    if _checked_month == (today.year, today.month):
+        return []
+    _checked_month = (today.year, today.month)
+    return ensure_partitions()
+
+
+def create_on_migrate(using, **kwargs):
+    """post_migrate: después de cada migrate quedan las particiones de los próximos meses."""
+    if using == DEFAULT_DB_ALIAS:
+        ensure_partitions()
+
+
+def drop_partition(name):
+    """Separa y borra una partición entera. Va dentro de la transacción del que llama."""
+    if not _NAME.match(name):
+        raise ValueError(f'{name} no es una partición mensual de {TABLE}')
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        cursor.execute(f'DROP TABLE {name}')
@@ -0,0 +1,132 @@
+"""
+Agregado diario de visitas (PageViewDaily).
+
+record() lo actualiza con cada lote que guarda el buffer (buffer.py): suma las
+vistas y une el sketch de visitantes de cada (día local, página, referrer).
+rebuild() lo recalcula desde PageView para los días que todavía tienen filas
+crudas (manage.py rollup_pageviews). En PostgreSQL los dos toman un advisory
+lock por día: record() compartido, rebuild() exclusivo, así un lote que llega
+mientras se recalcula su día no se pierde ni se cuenta dos veces.
+
+visit_rows() es lo que leen el dashboard y el MCP: los días cerrados salen de
+PageViewDaily y el de hoy de PageView, con la misma forma.
+
+monthly_unique_visitors() une los sketches de PageViewMonthly.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ab_reservas_project.localtime import day_filter, local_day
+
+from .hll import Sketch
+from .models import PageView, PageViewDaily
+
+
+# Primer argumento de pg_advisory_xact_lock(int, int); el segundo es el día.
+LOCK_NAMESPACE = 0x524F4C4C  # 'ROLL'
+
+
+def _lock_days(days, exclusive):
+    if connection.vendor != 'postgresql':
+        return
+    function = 'pg_advisory_xact_lock' if exclusive else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        # Siempre en el mismo orden, para que dos lotes no se bloqueen entre sí.
+        for day in sorted(set(days)):
+            cursor.execute(f'SELECT {function}(%s, %s)', [LOCK_NAMESPACE, day.toordinal()])
+
+
+def _group(pageviews):
+    """{(día, página, referrer): [vistas, Sketch]} de PageViews o tuplas crudas."""
+    groups = {}
+    for timestamp, page, referrer, ip_hash in pageviews:
+        group = groups.setdefault((local_day(timestamp), page, referrer), [0, Sketch()])
+        group[0] += 1
+        group[1].add(ip_hash)
+    return groups
+
+
+def record(pageviews):
+    """Suma un lote de PageView ya guardados al agregado diario."""
+    groups = _group((pv.timestamp, pv.page, pv.referrer, pv.ip_hash) for pv in pageviews)
+    with transaction.atomic():
+        _lock_days((day for day, _, _ in groups), exclusive=False)
+        # Siempre en el mismo orden: dos workers con lotes cruzados no se bloquean.
+        for (day, page, referrer), (views, sketch) in sorted(groups.items(), key=lambda g: g[0]):
+            row, _ = PageViewDaily.objects.select_for_update().get_or_create(
+                day=day, page=page, referrer=referrer,
+            )
+            row.views += views
+            row.visitors = sketch.merge_bytes(row.visitors).to_bytes()
+            row.save(update_fields=['views', 'visitors'])
+
+
+def rebuild(start, end):
+    """
+    Recalcula los días [start, end] desde PageView. Solo tiene sentido para
+    días que conservan todas sus filas crudas; los más viejos quedan como están.
+    Lee y reescribe con los días bloqueados: los record() de esos días esperan.
+    """
+    with transaction.atomic():
+        _lock_days((start + timedelta(days=i) for i in range((end - start).days + 1)), exclusive=True)
+        raw = PageView.objects.filter(
+            **day_filter('timestamp', start, end),
+        ).values_list('timestamp', 'page', 'referrer', 'ip_hash')
+        groups = _group(raw.iterator(chunk_size=2000))
+        PageViewDaily.objects.filter(day__gte=start, day__lte=end).delete()
+        PageViewDaily.objects.bulk_create([
+            PageViewDaily(day=day, page=page, referrer=referrer,
+                          views=views, visitors=sketch.to_bytes())
+            for (day, page, referrer), (views, sketch) in groups.items()
+        ], batch_size=500)
+    return sum(views for views, _ in groups.values())
+
+
+def visit_rows(start, end, page=None):
+    """
+    Vistas por (día, página, referrer) entre start y end inclusive:
+    [{'day', 'page', 'referrer', 'views', 'visitors' (sketch serializado)}].
+    """
+    today = local_day(timezone.now())
+    rows = []
+
+    daily = PageViewDaily.objects.filter(day__gte=start, day__lte=min(end, today - timedelta(days=1)))
+    if page:
+        daily = daily.filter(page=page)
+    rows.extend(daily.values('day', 'page', 'referrer', 'views', 'visitors'))
+
+    if start <= today <= end:
+        raw = PageView.objects.filter(**day_filter('timestamp', today))
+        if page:
+            raw = raw.filter(page=page)
+        groups = _group(raw.values_list('timestamp', 'page', 'referrer', 'ip_hash'))
+        rows.extend(
+            {'day': day, 'page': pg, 'referrer': referrer, 'views': views, 'visitors': sketch.to_bytes()}
+            for (day, pg, referrer), (views, sketch) in groups.items()
+            if day == today
+        )
+    return rows
+
+
+def unique_visitors(rows):
+    """Visitantes únicos (estimados) de un conjunto de filas de visit_rows()."""
+    sketch = Sketch()
+    for row in rows:
+        sketch.merge_bytes(row['visitors'])
+    return sketch.count()
+
+
+def monthly_unique_visitors(months):
+    """
+    Visitantes únicos de varias filas de PageViewMonthly (unión de sketches).
+    Lo consolidado antes de los sketches (legacy_unique_visitors) no se puede
+    unir: se suma tal cual.
+    """
+    sketch = Sketch()
+    legacy = 0
+    for month in months:
+        sketch.merge_bytes(month.visitors)
+        legacy += month.legacy_unique_visitors
+    return sketch.count() + legacy
@@ -1,10 +1,12 @@
 import hashlib
 import json
 
-from django.core.cache import cache
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from app_fractalia.ratelimit import allow, client_ip
+
+from .buffer import pageviews
 from .models import PageView, VALID_PAGE_KEYS
 
 # Dominios permitidos para el endpoint de tracking del frontend React.
@@ -22,20 +24,11 @@ RATE_LIMIT = 10
 RATE_WINDOW_SECONDS = 60
 
 
-def _get_ip(request) -> str:
-    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
-    if forwarded:
-        return forwarded.split(',')[0].strip()
-    return request.META.get('REMOTE_ADDR', '0.0.0.0')
-
-
 def _is_rate_limited(ip: str) -> bool:
-    key = f'analytics_rl_{hashlib.md5(ip.encode()).hexdigest()}'
-    count = cache.get(key, 0)
-    if count >= RATE_LIMIT:
-        return True
-    cache.set(key, count + 1, RATE_WINDOW_SECONDS)
-    return False
+    # El balde compartido de app_fractalia/ratelimit.py: un solo límite para
+    # todos los workers, y los rechazos quedan en RateLimitStat. Es un UPSERT
+    # por pedido; la visita en sí se sigue escribiendo en lote (buffer.py).
+    return not allow('analytics_track', ip, RATE_LIMIT, RATE_WINDOW_SECONDS)
 
 
 def _get_allowed_origin(request) -> str | None:
@@ -81,7 +74,7 @@ def track_pageview(request):
     if not allowed_origin:
         return JsonResponse({'ok': False, 'error': 'forbidden'}, status=403)
 
-    ip = _get_ip(request)
+    ip = client_ip(request)
     if _is_rate_limited(ip):
         resp = JsonResponse({'ok': False, 'error': 'rate_limited'}, status=429)
         _add_cors(resp, allowed_origin)
@@ -103,12 +96,13 @@ def track_pageview(request):
     referrer_url = str(data.get('referrer', ''))[:200]
     user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-    PageView.objects.create(
+    # Se guarda en lote (buffer.py); el request no espera el INSERT.
+    pageviews.add(PageView(
         page=page,
         ip_hash=PageView.hash_ip(ip),
         referrer=PageView.extract_referrer_domain(referrer_url),
         user_agent_hash=hashlib.sha256(user_agent.encode()).hexdigest() if user_agent else '',
-    )
+    ))
 
     resp = JsonResponse({'ok': True})
     _add_cors(resp, allowed_origin)
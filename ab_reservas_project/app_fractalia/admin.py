@@ -6,8 +6,9 @@ import re
 import zoneinfo
 from .models import (
     Resource, WeeklyAvailability, Booking, PendingBooking, Product, FractaboxPackage,
-    get_fractabox_package_for_hours,
+    RateLimitStat, get_fractabox_package_for_hours,
 )
+from .confirmation import confirm_pending_bookings
 
 _ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
 
@@ -134,7 +135,7 @@ class BookingAdmin(admin.ModelAdmin):
     list_display = ('resource', 'formatted_date', 'reservation_code', 'client_name', 'end_datetime', 'client_phone', 'product', 'status_display', 'whatsapp_contact')
     list_filter = ('resource', 'status', 'start_datetime')
     search_fields = ('resource__name', 'notes', 'client_phone', 'client_name', 'product__name')
-    readonly_fields = ('created_at', 'whatsapp_link_display')
+    readonly_fields = ('created_at', 'pending_booking', 'whatsapp_link_display')
     date_hierarchy = 'start_datetime'
     ordering = ('start_datetime',)
     actions = ['cancelar', 'reactivar']
@@ -152,7 +153,7 @@ class BookingAdmin(admin.ModelAdmin):
             'fields': ('notes',)
         }),
         ('Metadata', {
-            'fields': ('created_at',),
+            'fields': ('pending_booking', 'created_at'),
             'classes': ('collapse',)
         }),
     )
@@ -274,19 +275,9 @@ class BookingAdmin(admin.ModelAdmin):
                 booking.save()
                 cancelled_count += 1
 
-                # Buscar y marcar la PendingBooking padre como CANCELLED
-                code = booking.reservation_code
-                if not code and booking.notes:
-                    match = re.search(r'Código de reserva: (\w+)', booking.notes)
-                    if match:
-                        code = match.group(1)
-                if code:
-                    try:
-                        pending = PendingBooking.objects.get(reservation_code=code)
-                        pending.status = 'CANCELLED'
-                        pending.save()
-                    except PendingBooking.DoesNotExist:
-                        pass
+                # Marcar la PendingBooking padre como CANCELLED
+                if booking.pending_booking_id:
+                    PendingBooking.objects.filter(pk=booking.pending_booking_id).update(status='CANCELLED')
             else:
                 incompatible_count += 1
 
@@ -311,19 +302,9 @@ class BookingAdmin(admin.ModelAdmin):
                 booking.save()
                 reactivated_count += 1
 
-                # Buscar y marcar la PendingBooking padre como CONFIRMED
-                code = booking.reservation_code
-                if not code and booking.notes:
-                    match = re.search(r'Código de reserva: (\w+)', booking.notes)
-                    if match:
-                        code = match.group(1)
-                if code:
-                    try:
-                        pending = PendingBooking.objects.get(reservation_code=code)
-                        pending.status = 'CONFIRMED'
-                        pending.save()
-                    except PendingBooking.DoesNotExist:
-                        pass
+                # Marcar la PendingBooking padre como CONFIRMED
+                if booking.pending_booking_id:
+                    PendingBooking.objects.filter(pk=booking.pending_booking_id).update(status='CONFIRMED')
             else:
                 incompatible_count += 1
 
@@ -542,44 +523,20 @@ class PendingBookingAdmin(admin.ModelAdmin):
 
     def confirmar(self, request, queryset):
         """PENDING/REJECTED → CONFIRMED: Crea Booking y marca como confirmada"""
+        statuses = ('PENDING', 'REJECTED')
+        selected = list(queryset)
+        candidates = [p for p in selected if p.status in statuses]
+        incompatible_count = len(selected) - len(candidates)
         confirmed_count = 0
-        incompatible_count = 0
-        for pending in queryset:
-            if pending.status in ('PENDING', 'REJECTED'):
-                try:
-                    start_dt = _asuncion(datetime.combine(pending.date, pending.start_time))
-                    end_dt   = _asuncion(datetime.combine(pending.date, pending.end_time))
-                    duration_hours = int((end_dt - start_dt).total_seconds() / 3600)
-                    fractabox_package = None
-                    if pending.product and pending.product.product_type == 'FRACTABOX':
-                        fractabox_package = get_fractabox_package_for_hours(pending.product, duration_hours)
-                        if not fractabox_package:
-                            raise ValueError('Duración inválida para Fractabox')
-
-                    Booking.objects.create(
-                        resource=pending.resource,
-                        product=pending.product,
-                        fractabox_package=fractabox_package,
-                        reservation_code=pending.reservation_code,
-                        client_name=pending.client_name,
-                        start_datetime=start_dt,
-                        end_datetime=end_dt,
-                        status='CONFIRMED',
-                        client_phone=pending.client_phone,
-                        notes=f'Código de reserva: {pending.reservation_code}'
-                    )
-                    pending.status = 'CONFIRMED'
-                    pending.save()
-                    confirmed_count += 1
-                except Exception as e:
-                    error_msg = str(e).replace('["__all__"]', '').replace('{', '').replace('}', '').strip("'\"")
-                    self.message_user(
-                        request,
-                        f'No se pudo confirmar {pending.reservation_code}: {error_msg}',
-                        messages.ERROR
-                    )
+        for pending, booking, error in confirm_pending_bookings(candidates, allowed_statuses=statuses):
+            if booking:
+                confirmed_count += 1
             else:
-                incompatible_count += 1
+                self.message_user(
+                    request,
+                    f'No se pudo confirmar {pending.reservation_code}: {error}',
+                    messages.ERROR
+                )
 
         if confirmed_count > 0:
             mensaje = f'{confirmed_count} solicitud confirmada.' if confirmed_count == 1 else f'{confirmed_count} solicitudes confirmadas.'
@@ -599,10 +556,7 @@ class PendingBookingAdmin(admin.ModelAdmin):
         for pending in queryset:
             if pending.status == 'CONFIRMED':
                 try:
-                    Booking.objects.filter(
-                        resource=pending.resource,
-                        notes__contains=pending.reservation_code
-                    ).delete()
+                    Booking.objects.filter(pending_booking=pending).delete()
                     pending.status = 'PENDING'
                     pending.save()
                     undone_count += 1
@@ -648,3 +602,12 @@ class PendingBookingAdmin(admin.ModelAdmin):
     confirmar.short_description = 'Confirmar turno'
     responder.short_description = 'Marcar como Respondida (sin confirmar turno)'
     deshacer.short_description = 'Deshacer confirmación'
+
+
+@admin.register(RateLimitStat)
+class RateLimitStatAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'shed', 'last_shed_at')
+    ordering = ('scope',)
+
+    def has_add_permission(self, request):    return False
+    def has_change_permission(self, request, obj=None): return False
@@ -6,3 +6,5 @@ class AppFractaliaConfig(AppConfig):
     name = 'app_fractalia'
     verbose_name = 'Fractalia - Calendario'
 
+    def ready(self):
+        from . import signals  # noqa: F401
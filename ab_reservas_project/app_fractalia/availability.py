@@ -0,0 +1,477 @@
+"""
+Motor de disponibilidad del calendario.
+
+Antes cada slot de una hora hacía su propio exists() contra Booking: entre 10 y
+18 consultas por día. Acá se traen de una sola vez las reservas confirmadas que
+tocan la ventana pedida y los slots se marcan en memoria, con un barrido sobre
+los intervalos ordenados.
+
+El chequeo es cross-resource a propósito: el espacio físico es uno solo, así
+que cualquier reserva confirmada bloquea el horario para todos los recursos.
+
+Las funciones con prefijo `a` son las versiones async que usan las vistas ASGI;
+las sync siguen para el MCP y el admin. Ambas comparten todo salvo la consulta.
+"""
+import bisect
+import calendar
+import math
+import zoneinfo
+from datetime import date, datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+from .models import Booking, WeeklyAvailability
+
+ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
+
+# Grilla de staff: el día completo (5-23h), sin restricción de WeeklyAvailability.
+STAFF_START_HOUR = 5
+STAFF_END_HOUR = 23
+
+# Tope de días por pedido a get_days_overview. El calendario pide de a 15; el
+# tope evita que un cliente pida años de una vez.
+MAX_WINDOW_DAYS = 62
+
+# Tope de candidatos por pedido a check_candidates desde la API.
+MAX_BATCH_CANDIDATES = 50
+
+# Búsqueda de huecos libres: cuántas semanas hacia adelante mira y cuántos
+# huecos devuelve como mucho.
+FREE_WINDOW_HORIZON_DAYS = 28
+MAX_FREE_WINDOWS = 20
+
+
+def local_dt(fecha, hora):
+    """datetime aware en hora de Asunción (lo mismo que Django hace con un naive)."""
+    return datetime.combine(fecha, hora).replace(tzinfo=ASUNCION)
+
+
+def schedule_hours(availability):
+    """Horas en punto [inicio, fin) que cubre un WeeklyAvailability."""
+    end_hour = availability.end_time.hour
+    if availability.end_time.minute > 0:
+        end_hour += 1
+    return availability.start_time.hour, end_hour
+
+
+def slot_windows(fecha, start_hour, end_hour):
+    """
+    (hora, inicio, fin) de cada slot de una hora del día. El slot de las 23
+    cierra a las 23:59 para no pasar al día siguiente.
+    """
+    windows = []
+    for hour in range(start_hour, end_hour):
+        slot_start = time(hour=hour)
+        slot_end = time(hour=hour + 1) if hour + 1 <= 23 else time(23, 59)
+        windows.append((slot_start, local_dt(fecha, slot_start), local_dt(fecha, slot_end)))
+    return windows
+
+
+def _confirmed_intervals_qs(start, end):
+    return (
+        Booking.objects.confirmed_overlapping(start, end)
+        .order_by('start_datetime')
+        .values_list('start_datetime', 'end_datetime')
+    )
+
+
+def confirmed_intervals(start, end):
+    """
+    Reservas confirmadas que solapan [start, end), como pares (inicio, fin)
+    ordenados por inicio. Es la única consulta a Booking del motor.
+    """
+    return list(_confirmed_intervals_qs(start, end))
+
+
+async def aconfirmed_intervals(start, end):
+    """Versión async de confirmed_intervals, para las vistas ASGI."""
+    return [pair async for pair in _confirmed_intervals_qs(start, end)]
+
+
+def merge_intervals(intervals):
+    """Fusiona intervalos ordenados por inicio en tramos ocupados disjuntos."""
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def sweep_busy(windows, merged):
+    """
+    Para cada ventana (ordenadas por inicio y sin solaparse entre sí) dice si
+    la pisa algún tramo ocupado. Ventanas y tramos avanzan juntos, así que el
+    costo es lineal en la suma de ambos.
+    """
+    busy = []
+    j = 0
+    for _, start, end in windows:
+        while j < len(merged) and merged[j][1] <= start:
+            j += 1
+        busy.append(j < len(merged) and merged[j][0] < end)
+    return busy
+
+
+def build_slots(windows, merged):
+    """Slots con el formato que consumen la API y el MCP."""
+    return [
+        {
+            'time': slot_start.strftime('%H:%M'),
+            'available': not is_busy,
+            'display': slot_start.strftime('%H:%M'),
+        }
+        for (slot_start, _, _), is_busy in zip(windows, sweep_busy(windows, merged))
+    ]
+
+
+def fractabox_slots_needed(slots_to_block, duration_minutes=None):
+    """
+    Slots de una hora que ocupa un paquete Fractabox. Si el paquete declara su
+    duración real y no entra en slots_to_block horas, manda la duración.
+    """
+    needed = max(1, slots_to_block)
+    if duration_minutes:
+        needed = max(needed, math.ceil(duration_minutes / 60))
+    return needed
+
+
+def mark_available_as_start(slots, slots_needed):
+    """
+    Marca available_as_start en cada slot: si desde ahí hay slots_needed slots
+    libres seguidos dentro del día.
+
+    Una sola pasada de atrás hacia adelante llevando la racha de slots libres;
+    los slots de la grilla son horas consecutivas, así que la racha es la
+    ventana de horas libres que arranca en cada slot.
+    """
+    run = 0
+    for slot in reversed(slots):
+        run = run + 1 if slot['available'] else 0
+        slot['available_as_start'] = run >= slots_needed
+    return slots
+
+
+def _span(windows):
+    """(inicio, fin) que cubre una lista de ventanas ordenadas, o None si está vacía."""
+    return (windows[0][1], windows[-1][2]) if windows else None
+
+
+def _day_hours(availability, staff):
+    if staff:
+        return STAFF_START_HOUR, STAFF_END_HOUR
+    return schedule_hours(availability) if availability else None
+
+
+def get_day_slots(resource, fecha, staff=False):
+    """
+    Slots de un día con su disponibilidad. None si el recurso no tiene horario
+    configurado ese día de la semana (en modo staff siempre hay grilla).
+    """
+    availability = None
+    if not staff:
+        availability = WeeklyAvailability.objects.filter(
+            resource=resource,
+            weekday=fecha.weekday(),
+        ).first()
+    hours = _day_hours(availability, staff)
+    if not hours:
+        return None
+
+    windows = slot_windows(fecha, *hours)
+    span = _span(windows)
+    intervals = confirmed_intervals(*span) if span else []
+    return build_slots(windows, merge_intervals(intervals))
+
+
+async def aget_day_slots(resource, fecha, staff=False):
+    """Versión async de get_day_slots: mismas consultas, por la ORM async."""
+    availability = None
+    if not staff:
+        availability = await WeeklyAvailability.objects.filter(
+            resource=resource,
+            weekday=fecha.weekday(),
+        ).afirst()
+    hours = _day_hours(availability, staff)
+    if not hours:
+        return None
+
+    windows = slot_windows(fecha, *hours)
+    span = _span(windows)
+    intervals = await aconfirmed_intervals(*span) if span else []
+    return build_slots(windows, merge_intervals(intervals))
+
+
+def weekly_schedule(resource):
+    """weekday -> WeeklyAvailability del recurso, en una sola consulta."""
+    return {a.weekday: a for a in WeeklyAvailability.objects.filter(resource=resource)}
+
+
+async def aweekly_schedule(resource):
+    return {a.weekday: a async for a in WeeklyAvailability.objects.filter(resource=resource)}
+
+
+def busy_by_day(day_windows, intervals):
+    """
+    Recibe [(fecha, ventanas)] de días seguidos y las reservas confirmadas que
+    tocan la racha (ordenadas por inicio), y devuelve para cada día la lista de
+    flags ocupado/libre de sus ventanas.
+    """
+    all_windows = [w for _, windows in day_windows for w in windows]
+    busy = iter(sweep_busy(all_windows, merge_intervals(intervals)))
+    return [[next(busy) for _ in windows] for _, windows in day_windows]
+
+
+def _window_span(day_windows):
+    return _span([w for _, windows in day_windows for w in windows])
+
+
+# Las vistas de varios días se arman en tres pasos: ventanas (con el horario
+# ya cargado), una consulta de reservas para toda la racha, y el resultado.
+# Así la versión sync y la async solo difieren en cómo consultan.
+
+def _overview_windows(schedule, from_date, days):
+    day_windows = []
+    for i in range(days):
+        fecha = from_date + timedelta(days=i)
+        hours = _day_hours(schedule.get(fecha.weekday()), staff=False)
+        day_windows.append((fecha, slot_windows(fecha, *hours) if hours else []))
+    return day_windows
+
+
+def _overview(day_windows, intervals):
+    days_info = []
+    for (fecha, windows), flags in zip(day_windows, busy_by_day(day_windows, intervals)):
+        days_info.append({
+            'fecha': fecha.strftime('%Y-%m-%d'),
+            'weekday': fecha.weekday(),
+            'has_availability': bool(windows) and not all(flags),
+            'has_schedule': bool(windows),
+        })
+    return days_info
+
+
+def get_days_overview(resource, from_date, days):
+    """
+    has_schedule / has_availability de `days` días seguidos desde from_date.
+
+    Carga el horario semanal una vez y las reservas de toda la ventana una vez:
+    el costo en consultas no depende de cuántos días se pidan.
+    """
+    day_windows = _overview_windows(weekly_schedule(resource), from_date, days)
+    span = _window_span(day_windows)
+    return _overview(day_windows, confirmed_intervals(*span) if span else [])
+
+
+async def aget_days_overview(resource, from_date, days):
+    day_windows = _overview_windows(await aweekly_schedule(resource), from_date, days)
+    span = _window_span(day_windows)
+    return _overview(day_windows, await aconfirmed_intervals(*span) if span else [])
+
+
+def _month_windows(schedule, year, month, staff):
+    day_hours, day_windows = [], []
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        fecha = date(year, month, day)
+        hours = _day_hours(None if staff else schedule.get(fecha.weekday()), staff)
+        day_hours.append(hours)
+        day_windows.append((fecha, slot_windows(fecha, *hours) if hours else []))
+    return day_hours, day_windows
+
+
+def _month_grid(day_hours, day_windows, intervals):
+    grid = []
+    for hours, (_, windows), flags in zip(day_hours, day_windows,
+                                          busy_by_day(day_windows, intervals)):
+        if not hours:
+            grid.append(None)
+            continue
+        mask = 0
+        for (slot_start, _, _), is_busy in zip(windows, flags):
+            if is_busy:
+                mask |= 1 << slot_start.hour
+        grid.append([hours[0], hours[1], mask])
+    return grid
+
+
+def get_month_grid(resource, year, month, staff=False):
+    """
+    Un mes entero en formato compacto, para que el calendario dibuje
+    indicadores y grillas de todos los días con una sola respuesta.
+
+    Devuelve una entrada por día del mes (la 0 es el día 1): None si ese día no
+    hay horario, o [hora_inicio, hora_fin, ocupadas]. `ocupadas` es una máscara
+    de bits por hora: el bit h prendido quiere decir que el slot que arranca a
+    las h está tomado. Los slots son las horas en punto de [inicio, fin).
+    """
+    schedule = {} if staff else weekly_schedule(resource)
+    day_hours, day_windows = _month_windows(schedule, year, month, staff)
+    span = _window_span(day_windows)
+    return _month_grid(day_hours, day_windows, confirmed_intervals(*span) if span else [])
+
+
+async def aget_month_grid(resource, year, month, staff=False):
+    schedule = {} if staff else await aweekly_schedule(resource)
+    day_hours, day_windows = _month_windows(schedule, year, month, staff)
+    span = _window_span(day_windows)
+    return _month_grid(day_hours, day_windows, await aconfirmed_intervals(*span) if span else [])
+
+
+def check_candidates(resource, candidates):
+    """
+    Responde "¿está libre?" para varios horarios candidatos de una vez.
+
+    `candidates` es una lista de (fecha, hora_inicio, hora_fin). Para cada uno
+    devuelve las reservas confirmadas que lo pisan (cualquier recurso: el
+    espacio es uno solo) y si cae dentro del horario semanal del recurso, con
+    el mismo criterio que Booking.clean(). Trae el horario en una consulta y
+    las reservas en otra, sin importar cuántos candidatos sean. Esa consulta
+    cubre solo los días que tienen candidatos (la envolvente de cada uno): dos
+    candidatos con años de distancia no traen todo lo que hay en el medio.
+    """
+    if not candidates:
+        return []
+
+    schedule = weekly_schedule(resource)
+    ranges = [(local_dt(f, hi), local_dt(f, hf)) for f, hi, hf in candidates]
+
+    by_day = {}
+    for (fecha, _, _), (start, end) in zip(candidates, ranges):
+        day_start, day_end = by_day.get(fecha, (start, end))
+        by_day[fecha] = (min(day_start, start), max(day_end, end))
+    bookings = list(
+        reduce(or_, (Booking.objects.confirmed_overlapping(*span) for span in by_day.values()))
+        .order_by('start_datetime')
+    )
+    # Inicios ordenados y máximo acumulado de los fines (no decreciente): los
+    # candidatos a solapar un intervalo salen con dos bisecciones.
+    starts = [b.start_datetime for b in bookings]
+    max_ends, top = [], None
+    for b in bookings:
+        top = b.end_datetime if top is None or b.end_datetime > top else top
+        max_ends.append(top)
+
+    results = []
+    for (fecha, start_time, end_time), (start, end) in zip(candidates, ranges):
+        hi = bisect.bisect_left(starts, end)
+        lo = bisect.bisect_right(max_ends, start, 0, hi)
+        conflicts = [b for b in bookings[lo:hi] if b.end_datetime > start]
+
+        availability = schedule.get(fecha.weekday())
+        within_schedule = bool(
+            availability
+            and availability.start_time <= start_time
+            and end_time <= availability.end_time
+        )
+        results.append({
+            'fecha': fecha,
+            'start_time': start_time,
+            'end_time': end_time,
+            'conflicts': conflicts,
+            'schedule': (availability.start_time, availability.end_time) if availability else None,
+            'within_schedule': within_schedule,
+            'available': not conflicts and within_schedule,
+        })
+    return results
+
+
+def default_window_minutes(product):
+    """
+    Largo mínimo de un hueco útil para el producto: el bloque más corto que el
+    calendario público deja reservar.
+    """
+    if product.product_type == 'ALQUILER':
+        return 120
+    if product.product_type == 'FRACTABOX':
+        # Sobre packages.all() para aprovechar un prefetch_related (vistas async).
+        needed = [
+            fractabox_slots_needed(p.slots_to_block, p.duration_minutes)
+            for p in product.packages.all() if p.is_active
+        ]
+        if needed:
+            return min(needed) * 60
+    return 60
+
+
+def _ceil_hour(dt):
+    floor = dt.replace(minute=0, second=0, microsecond=0)
+    return floor if floor == dt else floor + timedelta(hours=1)
+
+
+def _open_ranges(schedule, after, length, horizon_days):
+    """Tramos de atención [inicio, fin) desde `after`, uno por día con horario."""
+    after = after.astimezone(ASUNCION)
+    ranges = []
+    for i in range(horizon_days):
+        fecha = after.date() + timedelta(days=i)
+        availability = schedule.get(fecha.weekday())
+        if not availability:
+            continue
+        start = max(local_dt(fecha, availability.start_time), after)
+        end = local_dt(fecha, availability.end_time)
+        if end - start >= length:
+            ranges.append((start, end))
+    return ranges
+
+
+def _free_windows(open_ranges, intervals, length, count):
+    """
+    Resta los tramos ocupados a los de atención en una sola pasada: ambos
+    están ordenados, así que el índice de ocupados solo avanza. Cada hueco
+    arranca en hora en punto, como la grilla del calendario.
+    """
+    merged = merge_intervals(intervals)
+    windows = []
+
+    def offer(start, end):
+        # Los ocupados vienen de la base en UTC; los huecos se dan en hora local.
+        start, end = _ceil_hour(start.astimezone(ASUNCION)), end.astimezone(ASUNCION)
+        if end - start >= length:
+            windows.append({'start': start, 'end': end})
+
+    j = 0
+    for start, end in open_ranges:
+        while j < len(merged) and merged[j][1] <= start:
+            j += 1
+        cursor = start
+        k = j
+        while k < len(merged) and merged[k][0] < end:
+            if merged[k][0] > cursor:
+                offer(cursor, merged[k][0])
+            cursor = max(cursor, merged[k][1])
+            k += 1
+        if cursor < end:
+            offer(cursor, end)
+        if len(windows) >= count:
+            return windows[:count]
+    return windows
+
+
+def find_free_windows(resource, after, length, count=3,
+                      horizon_days=FREE_WINDOW_HORIZON_DAYS, intervals_for=confirmed_intervals):
+    """
+    Los próximos `count` huecos libres de al menos `length` (timedelta) después
+    de `after` (aware), dentro del horario semanal del recurso.
+
+    Cada hueco es {'start', 'end'}: arranca en hora en punto y llega hasta
+    donde sigue libre, así que entra cualquier reserva de `length` que empiece
+    en `start`. `intervals_for(inicio, fin)` da las reservas confirmadas
+    ordenadas; por defecto las consulta una vez para todo el horizonte, y el
+    MCP pasa su índice en memoria.
+    """
+    ranges = _open_ranges(weekly_schedule(resource), after, length, horizon_days)
+    if not ranges:
+        return []
+    intervals = intervals_for(ranges[0][0], ranges[-1][1])
+    return _free_windows(ranges, intervals, length, count)
+
+
+async def afind_free_windows(resource, after, length, count=3,
+                             horizon_days=FREE_WINDOW_HORIZON_DAYS):
+    ranges = _open_ranges(await aweekly_schedule(resource), after, length, horizon_days)
+    if not ranges:
+        return []
+    intervals = await aconfirmed_intervals(ranges[0][0], ranges[-1][1])
+    return _free_windows(ranges, intervals, length, count)
@@ -0,0 +1,121 @@
+"""
+Caché versionada de las APIs de disponibilidad.
+
+La respuesta solo cambia cuando cambia una reserva o el horario, así que cada
+clave lleva la generación global (BookingGeneration) y nunca hace falta
+invalidar nada: al subir la generación, las claves viejas dejan de pedirse y
+expiran solas.
+
+La generación vive en la base porque la comparten los workers de uvicorn y el
+MCP, que corre en otro contenedor. Cada proceso la recuerda unos segundos en
+su caché local: así un 304 no toca la base. El proceso que escribe la olvida
+al confirmar la transacción; los demás la ven a lo sumo GENERATION_TTL
+segundos tarde, y create_pending_booking igual vuelve a chequear el solapamiento.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .models import BookingGeneration
+
+GENERATION_CACHE_KEY = 'fractalia:booking_generation'
+GENERATION_TTL = 2  # segundos
+
+# Canal de PostgreSQL por el que se avisa cada cambio de generación. Lo escucha
+# el índice de reservas del MCP (mcp_server/indice.py).
+BOOKINGS_CHANNEL = 'fractalia_bookings'
+
+# Las respuestas no expiran por tiempo sino por generación; el TTL solo acota
+# lo que ocupan en memoria.
+RESPONSE_TTL = 60 * 10
+
+
+def _generation_qs():
+    return BookingGeneration.objects.filter(pk=1).values_list('generation', flat=True)
+
+
+def current_booking_generation():
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = _generation_qs().first() or 0
+        cache.set(GENERATION_CACHE_KEY, generation, GENERATION_TTL)
+    return generation
+
+
+async def acurrent_booking_generation():
+    generation = await cache.aget(GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = await _generation_qs().afirst() or 0
+        await cache.aset(GENERATION_CACHE_KEY, generation, GENERATION_TTL)
+    return generation
+
+
+def bump_booking_generation():
+    updated = BookingGeneration.objects.filter(pk=1).update(generation=F('generation') + 1)
+    if not updated:
+        BookingGeneration.objects.get_or_create(pk=1, defaults={'generation': 1})
+    if connection.vendor == 'postgresql':
+        # NOTIFY es transaccional: se entrega recién al confirmar.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [BOOKINGS_CHANNEL, ''])
+    transaction.on_commit(lambda: cache.delete(GENERATION_CACHE_KEY))
+
+
+def _digest(generation, key_parts):
+    version = (generation,) + tuple(key_parts)
+    return hashlib.sha1(repr(version).encode()).hexdigest()
+
+
+def _with_validators(response, etag):
+    response['ETag'] = etag
+    # Que el navegador revalide siempre: el ETag cambia con cada reserva.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def availability_response(request, key_parts, compute):
+    """
+    Sirve una respuesta JSON de disponibilidad desde la caché.
+
+    key_parts identifica la consulta (recurso, ventana de fechas, producto,
+    slots, modo staff) y compute() arma la respuesta si no está cacheada. Si el
+    cliente ya tiene esta misma versión (If-None-Match), devuelve 304 sin
+    calcular nada. Solo se cachean las respuestas 200.
+    """
+    digest = _digest(current_booking_generation(), key_parts)
+    etag = f'"{digest}"'
+
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        return _with_validators(HttpResponseNotModified(), etag)
+
+    key = f'fractalia:availability:{digest}'
+    content = cache.get(key)
+    if content is None:
+        response = compute()
+        if response.status_code != 200:
+            return response
+        content = response.content
+        cache.set(key, content, RESPONSE_TTL)
+    return _with_validators(HttpResponse(content, content_type='application/json'), etag)
+
+
+async def aavailability_response(request, key_parts, acompute):
+    """Igual que availability_response, para vistas async: acompute es una corrutina."""
+    digest = _digest(await acurrent_booking_generation(), key_parts)
+    etag = f'"{digest}"'
+
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        return _with_validators(HttpResponseNotModified(), etag)
+
+    key = f'fractalia:availability:{digest}'
+    content = await cache.aget(key)
+    if content is None:
+        response = await acompute()
+        if response.status_code != 200:
+            return response
+        content = response.content
+        await cache.aset(key, content, RESPONSE_TTL)
+    return _with_validators(HttpResponse(content, content_type='application/json'), etag)
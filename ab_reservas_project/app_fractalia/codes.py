@@ -0,0 +1,74 @@
+"""
+Códigos de reserva: permutación con clave de un contador.
+
+Los códigos son 4 caracteres de A-Z0-9 (36^4 = 1.679.616). En vez de sortear
+y preguntar si ya existe, cada reserva toma el siguiente número de un contador
+(ReservationCodeSequence) y lo pasa por una permutación de [0, 36^4): números
+distintos dan siempre códigos distintos, sin reintentos, y sin la clave la
+secuencia no se puede adivinar.
+
+La permutación es una red de Feistel sobre las dos mitades del número en base
+1296 (36^2 · 36^2 = 36^4, así que no sobra ningún valor). La clave (32 bytes)
+se guarda en la base junto al contador (ReservationCodeSequence.key) y no
+depende de ninguna configuración: si cambiara, los códigos nuevos podrían
+repetir viejos.
+"""
+import hashlib
+import hmac
+import string
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 4
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+_HALF = len(ALPHABET) ** (CODE_LENGTH // 2)
+_ROUNDS = 6
+
+
+def _round(key, i, half):
+    digest = hmac.new(key, f'{i}:{half}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') % _HALF
+
+
+def permute(n, key):
+    """Número del contador → posición en el espacio de códigos."""
+    left, right = divmod(n, _HALF)
+    for i in range(_ROUNDS):
+        left, right = right, (left + _round(key, i, right)) % _HALF
+    return left * _HALF + right
+
+
+def unpermute(x, key):
+    """Inversa de permute()."""
+    left, right = divmod(x, _HALF)
+    for i in reversed(range(_ROUNDS)):
+        left, right = (right - _round(key, i, left)) % _HALF, left
+    return left * _HALF + right
+
+
+def to_code(x):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        x, digit = divmod(x, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def is_valid(code):
+    return len(code) == CODE_LENGTH and all(char in ALPHABET for char in code)
+
+
+def from_code(code):
+    x = 0
+    for char in code:
+        x = x * len(ALPHABET) + ALPHABET.index(char)
+    return x
+
+
+def code_for(n, key):
+    """Código que corresponde al número n del contador."""
+    return to_code(permute(n, key))
+
+
+def index_of(code, key):
+    """Número del contador que produce `code`."""
+    return unpermute(from_code(code), key)
@@ -0,0 +1,182 @@
+"""
+Confirmación de pre-reservas: PENDING → CONFIRMED en un solo lugar.
+
+La usan la acción "Confirmar turno" del admin, el tool confirmar_reserva del
+MCP y reserva_directa. Cada confirmación corre en una transacción:
+
+  1. En PostgreSQL toma un advisory lock del día (pg_advisory_xact_lock), que
+     se suelta solo al terminar la transacción. Dos confirmaciones del mismo
+     día se ordenan; las de días distintos no se esperan. El lock es por día y
+     no por recurso porque el espacio físico es uno solo: las reservas chocan
+     entre recursos.
+  2. Hace todos los chequeos en una sola consulta: estado actual de la
+     pre-reserva, reserva confirmada que se pise, horario semanal del día y
+     paquete Fractabox que corresponde a la duración.
+  3. Crea el Booking sin volver a validar (ya se validó bajo el lock) y marca
+     la pre-reserva como confirmada.
+
+En SQLite no hay advisory locks; queda la transacción, y la base es de
+desarrollo. En PostgreSQL la restricción de exclusión sigue siendo la última
+garantía para los que escriben Booking por otro camino.
+"""
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .availability import ASUNCION
+from .models import Booking, FractaboxPackage, PendingBooking, Product, WeeklyAvailability
+
+# Primer argumento de pg_advisory_xact_lock(int, int): separa estos locks de
+# cualquier otro que use la base. El segundo es el día (ordinal).
+LOCK_NAMESPACE = 0x46524143  # 'FRAC'
+
+WEEKDAY_NAMES = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+class ConfirmationError(Exception):
+    """
+    No se pudo confirmar. code dice por qué ('invalid', 'status', 'overlap',
+    'schedule', 'package', 'duplicate'); conflicts trae las reservas
+    confirmadas que ocupan el horario.
+    """
+
+    def __init__(self, message, code='invalid', conflicts=()):
+        super().__init__(message)
+        self.code = code
+        self.conflicts = list(conflicts)
+
+
+def _lock_days(dates):
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        # Siempre en el mismo orden, para que dos lotes no se bloqueen entre sí.
+        for day in sorted(set(dates)):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [LOCK_NAMESPACE, day.toordinal()])
+
+
+def _period(pending):
+    start = datetime.combine(pending.date, pending.start_time, tzinfo=ASUNCION)
+    end = datetime.combine(pending.date, pending.end_time, tzinfo=ASUNCION)
+    return start, end
+
+
+def _checks(pending, start, end):
+    """Estado, solapamiento, horario y paquete, en una consulta."""
+    hours = int((end - start).total_seconds() / 3600)
+    schedule = WeeklyAvailability.objects.filter(
+        resource_id=OuterRef('resource_id'), weekday=pending.date.weekday(),
+    )
+    return PendingBooking.objects.filter(pk=pending.pk).annotate(
+        conflict_id=Subquery(
+            Booking.objects.confirmed_overlapping(start, end).order_by('start_datetime').values('id')[:1]
+        ),
+        schedule_start=Subquery(schedule.values('start_time')[:1]),
+        schedule_end=Subquery(schedule.values('end_time')[:1]),
+        product_type=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('product_type')[:1]),
+        package_id=Subquery(
+            FractaboxPackage.objects.filter(
+                product_id=OuterRef('product_id'), is_active=True, slots_to_block=hours,
+            ).order_by('order').values('id')[:1]
+        ),
+    ).values(
+        'status', 'conflict_id', 'schedule_start', 'schedule_end', 'product_type', 'package_id',
+    ).first()
+
+
+def _confirm(pending, allowed_statuses, check_schedule, require_package, notes):
+    start, end = _period(pending)
+    if end <= start:
+        raise ConfirmationError('La hora final debe ser más tarde que la hora de inicio.')
+
+    checks = _checks(pending, start, end)
+    if checks is None:
+        raise ConfirmationError('La pre-reserva ya no existe.', 'status')
+    if checks['status'] not in allowed_statuses:
+        label = dict(PendingBooking.STATUS_CHOICES).get(checks['status'], checks['status'])
+        raise ConfirmationError(f"La pre-reserva está en estado '{label}', no se puede confirmar.", 'status')
+    if checks['conflict_id'] is not None:
+        conflicts = Booking.objects.confirmed_overlapping(start, end).order_by('start_datetime')
+        raise ConfirmationError('Este horario ya está ocupado por otra reserva.', 'overlap', conflicts)
+    if check_schedule:
+        if checks['schedule_start'] is None:
+            raise ConfirmationError(
+                f'No hay horario disponible configurado para {WEEKDAY_NAMES[pending.date.weekday()]}.',
+                'schedule',
+            )
+        if not (checks['schedule_start'] <= pending.start_time and pending.end_time <= checks['schedule_end']):
+            raise ConfirmationError(
+                f'Este horario está fuera del horario disponible. '
+                f"Disponible de {checks['schedule_start']} a {checks['schedule_end']}.",
+                'schedule',
+            )
+    package_id = checks['package_id'] if checks['product_type'] == 'FRACTABOX' else None
+    if require_package and checks['product_type'] == 'FRACTABOX' and package_id is None:
+        raise ConfirmationError('Duración inválida para Fractabox', 'package')
+
+    booking = Booking(
+        pending_booking_id=pending.pk,
+        resource_id=pending.resource_id,
+        product_id=pending.product_id,
+        fractabox_package_id=package_id,
+        reservation_code=pending.reservation_code,
+        client_name=pending.client_name,
+        client_phone=pending.client_phone,
+        start_datetime=start,
+        end_datetime=end,
+        status='CONFIRMED',
+        notes=notes or f'Código de reserva: {pending.reservation_code}',
+    )
+    try:
+        booking.save(checked=True)
+    except ValidationError as e:
+        # La restricción de exclusión atrapó a alguien que escribió sin el lock.
+        conflicts = Booking.objects.confirmed_overlapping(start, end).order_by('start_datetime')
+        raise ConfirmationError(' '.join(e.messages), 'overlap', conflicts)
+    except IntegrityError:
+        raise ConfirmationError(f'Ya existe una reserva con el código {pending.reservation_code}.', 'duplicate')
+    PendingBooking.objects.filter(pk=pending.pk).update(status='CONFIRMED')
+    pending.status = 'CONFIRMED'
+    return booking
+
+
+def confirm_pending_booking(pending, *, allowed_statuses=('PENDING',), check_schedule=True,
+                            require_package=True, notes=None):
+    """
+    Confirma una pre-reserva y devuelve el Booking creado. Si no se puede,
+    levanta ConfirmationError y no queda nada a medias.
+
+    check_schedule=False saltea el horario semanal (reservas del staff);
+    require_package=False deja un Fractabox sin paquete si la duración no
+    coincide con ninguno.
+    """
+    with transaction.atomic():
+        _lock_days([pending.date])
+        return _confirm(pending, allowed_statuses, check_schedule, require_package, notes)
+
+
+def confirm_pending_bookings(pendings, *, allowed_statuses=('PENDING',), check_schedule=True,
+                             require_package=True, notes=None):
+    """
+    Variante en lote: una transacción y los locks de todos los días de una
+    vez. Cada confirmación va en su savepoint, así que una que falla no tira
+    las demás, y las del mismo lote que se pisan entre sí se detectan igual.
+
+    Devuelve [(pending, booking o None, ConfirmationError o None)] en el orden
+    recibido.
+    """
+    pendings = list(pendings)
+    results = []
+    with transaction.atomic():
+        _lock_days(p.date for p in pendings)
+        for pending in pendings:
+            try:
+                with transaction.atomic():
+                    booking = _confirm(pending, allowed_statuses, check_schedule, require_package, notes)
+            except ConfirmationError as e:
+                results.append((pending, None, e))
+            else:
+                results.append((pending, booking, None))
+    return results
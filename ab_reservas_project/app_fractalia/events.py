@@ -0,0 +1,242 @@
+"""
+Stream SSE de cambios de disponibilidad.
+
+El calendario abierto en una pestaña se entera de que un día cambió sin volver
+a pedir nada: los signals dejan una fila de AvailabilityChange por día tocado y
+cada stream las reenvía como eventos `availability`.
+
+Los streams no tocan la base. Un solo lector por proceso (_Feed) mira la
+generación de reservas (ver cache.py) y, cuando sube, lee las filas nuevas una
+vez y se las reparte por una asyncio.Queue a cada stream abierto. El lector
+corre en un hilo propio con una sola conexión: una pestaña abierta cuesta una
+cola en memoria, no una conexión a la base. Funciona igual en SQLite y en
+PostgreSQL, y con cualquier cantidad de workers o procesos escribiendo
+(admin, MCP).
+
+El id de cada evento es el id de la fila: al reconectar, EventSource manda
+Last-Event-ID y el stream sigue desde ahí (una consulta, en el hilo del
+lector). Si esas filas ya se purgaron, manda un evento con dates=null para que
+el cliente recargue todo.
+
+Los ids se asignan al insertar, no al confirmar: una transacción que tomó el
+id N puede confirmar después de que el lector ya pasó por N+1. Por eso cada
+vuelta, además de lo posterior al último id, relee lo creado en los últimos
+LOOKBACK y descarta lo ya repartido. Al reconectar se reenvía lo de esa
+ventana: un día repetido solo hace que el cliente lo vuelva a pedir.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import ASUNCION
+from .cache import GENERATION_TTL, current_booking_generation
+from .models import AvailabilityChange
+
+log = logging.getLogger(__name__)
+
+# Cuánto se guardan las filas de cambios.
+CHANGE_RETENTION = timedelta(hours=1)
+
+# Cada cuánto mira la generación el lector (no tiene sentido más seguido que su
+# TTL), cada cuánto manda un comentario cada stream para que proxies y
+# navegador no corten la conexión, y cuánto dura un stream antes de cerrarse
+# para que el cliente reconecte (no deja colgadas en nginx las conexiones HTTP
+# de pestañas olvidadas).
+POLL_SECONDS = GENERATION_TTL
+HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = 60 * 10
+RETRY_MS = 5000
+# Más que lo que dura la transacción más larga que toca reservas.
+LOOKBACK = timedelta(seconds=30)
+
+
+def booking_dates(start, end):
+    """Días locales que toca [start, end)."""
+    first = start.astimezone(ASUNCION).date()
+    last = (end - timedelta(microseconds=1)).astimezone(ASUNCION).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def record_availability_change(resource_id, dates=None):
+    """
+    Deja asentado qué días cambiaron (None: todos) y purga lo viejo. Se llama
+    desde los signals, dentro de la misma transacción que el cambio.
+    """
+    if dates is None:
+        AvailabilityChange.objects.create(resource_id=resource_id, date=None)
+    else:
+        AvailabilityChange.objects.bulk_create(
+            AvailabilityChange(resource_id=resource_id, date=d) for d in sorted(set(dates))
+        )
+    AvailabilityChange.objects.filter(created_at__lt=timezone.now() - CHANGE_RETENTION).delete()
+
+
+def _event(event_id, data, event='availability'):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+# Toda consulta del stream corre en este hilo: su conexión es la única que
+# usan los streams de este proceso, por muchos que haya abiertos.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='availability-feed')
+
+
+def _run_query(function, *args):
+    close_old_connections()
+    return function(*args)
+
+
+async def _db(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, _run_query, function, *args)
+
+
+def _newest_id():
+    return AvailabilityChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _changes(last_id, horizon):
+    return list(AvailabilityChange.objects.filter(Q(id__gt=last_id) | Q(created_at__gte=horizon)).order_by('id'))
+
+
+def _start():
+    """
+    Estado inicial del lector: generación, último id y lo creado dentro de
+    LOOKBACK (ya reflejado en las páginas que se están abriendo).
+    """
+    recent = AvailabilityChange.objects.filter(created_at__gte=timezone.now() - LOOKBACK)
+    return current_booking_generation(), _newest_id(), dict(recent.values_list('id', 'created_at'))
+
+
+def _resume(last_id):
+    """
+    Para un stream que reconecta: (si se perdió el hilo, último id, cambios
+    desde last_id y de la ventana LOOKBACK).
+    """
+    lost = False
+    if not AvailabilityChange.objects.filter(id=last_id).exists():
+        newest = _newest_id()
+        if newest > last_id or not newest:
+            # Lo que pasó mientras tanto ya se purgó.
+            lost, last_id = True, newest
+    return lost, last_id, _changes(last_id, timezone.now() - LOOKBACK)
+
+
+class _Feed:
+    """
+    El lector del proceso: vive mientras haya streams suscriptos y le pasa a
+    cada uno, por su cola, la lista de cambios nuevos de cada generación.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.subscribers = set()
+            # Contexto vacío: la tarea no queda atada al request que la arrancó.
+            self.task = loop.create_task(self._run(), context=contextvars.Context())
+        queue = asyncio.Queue()
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        generation, last_id, delivered = None, None, {}
+        try:
+            while self.subscribers:
+                try:
+                    if last_id is None:
+                        generation, last_id, delivered = await _db(_start)
+                    await asyncio.sleep(POLL_SECONDS)
+                    current = await _db(current_booking_generation)
+                    if current == generation:
+                        continue
+                    horizon = timezone.now() - LOOKBACK
+                    fresh = [c for c in await _db(_changes, last_id, horizon) if c.id not in delivered]
+                    generation = current
+                except Exception:
+                    log.exception('No se pudieron leer los cambios de disponibilidad')
+                    await asyncio.sleep(POLL_SECONDS)
+                    continue
+                for change in fresh:
+                    delivered[change.id] = change.created_at
+                    last_id = max(last_id, change.id)
+                delivered = {i: t for i, t in delivered.items() if t >= horizon}
+                if fresh:
+                    for queue in self.subscribers:
+                        queue.put_nowait(fresh)
+        finally:
+            self.task = None
+
+
+_feed = _Feed()
+
+
+async def availability_events(last_event_id=None):
+    """
+    Generador async del stream. Cada evento es
+    {"resource_id": R, "dates": ["YYYY-MM-DD", ...]} o dates=null si hay que
+    recargar todo. Los cambios de una misma generación van en un solo evento.
+    """
+    yield f'retry: {RETRY_MS}\n\n'
+
+    # Se suscribe antes de ponerse al día: lo que llegue mientras tanto queda
+    # en la cola, y lo repetido se descarta por id.
+    queue = _feed.subscribe()
+    try:
+        last_id = 0
+        sent = {}
+        pending = []
+        if last_event_id and last_event_id.isdigit():
+            lost, last_id, pending = await _db(_resume, int(last_event_id))
+            if lost:
+                yield _event(last_id, {'resource_id': None, 'dates': None})
+
+        started = last_beat = time.monotonic()
+        while True:
+            horizon = timezone.now() - LOOKBACK
+            by_resource = {}
+            for change in pending:
+                if change.id in sent:
+                    continue
+                sent[change.id] = change.created_at
+                last_id = max(last_id, change.id)
+                dates = by_resource.setdefault(change.resource_id, set())
+                if change.date is None or dates is None:
+                    by_resource[change.resource_id] = None
+                else:
+                    dates.add(change.date.strftime('%Y-%m-%d'))
+            sent = {i: t for i, t in sent.items() if t >= horizon}
+            for resource_id, dates in by_resource.items():
+                yield _event(last_id, {
+                    'resource_id': resource_id,
+                    'dates': sorted(dates) if dates is not None else None,
+                })
+                last_beat = time.monotonic()
+
+            now = time.monotonic()
+            if now - last_beat >= HEARTBEAT_SECONDS:
+                yield ': ping\n\n'
+                last_beat = now
+            remaining = STREAM_MAX_SECONDS - (now - started)
+            if remaining <= 0:
+                break
+            try:
+                pending = await asyncio.wait_for(
+                    queue.get(), min(remaining, HEARTBEAT_SECONDS - (now - last_beat))
+                )
+            except TimeoutError:
+                pending = []
+    finally:
+        _feed.unsubscribe(queue)
@@ -0,0 +1,108 @@
+"""
+Reintentos seguros de los POST públicos con el header Idempotency-Key.
+
+En una red mala el navegador puede mandar el mismo formulario dos veces sin
+haber visto la primera respuesta. Con @idempotent, el primer pedido con una
+clave se procesa y su respuesta queda guardada (IdempotencyKey); los que
+repiten la clave reciben esa misma respuesta, con el header
+Idempotent-Replayed, sin volver a escribir nada.
+
+La fila de la clave se inserta en la misma transacción que la vista: si dos
+reintentos llegan juntos, el segundo espera en el índice único hasta que el
+primero confirma, y después lee su respuesta. Solo se guardan las respuestas
+2xx; ante un error la transacción se deshace, la clave queda libre y el
+reintento vuelve a evaluarse.
+
+Sin header, la vista funciona igual que siempre.
+"""
+import hashlib
+import re
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = timedelta(hours=24)
+KEY_PATTERN = re.compile(r'[A-Za-z0-9_\-]{8,64}')
+
+
+def _replay(record, request_hash):
+    if record is None or record.status_code is None:
+        return JsonResponse(
+            {'error': 'La solicitud anterior con esta clave todavía se está procesando.'}, status=409
+        )
+    if record.request_hash != request_hash:
+        return JsonResponse(
+            {'error': 'Esta clave de idempotencia ya se usó con otros datos.'}, status=422
+        )
+    response = HttpResponse(
+        record.response_body, status=record.status_code, content_type='application/json'
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def has_stored_key(scope):
+    """
+    Para rate_limited(skip=...): True si el pedido trae una clave que ya está
+    guardada. Ese reintento no vuelve a ejecutar la vista (recibe la respuesta
+    guardada o un 409), así que no debería gastar tokens ni recibir un 429.
+    """
+    def check(request):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not KEY_PATTERN.fullmatch(key):
+            return False
+        return IdempotencyKey.objects.filter(
+            scope=scope, key=key, created_at__gte=timezone.now() - IDEMPOTENCY_TTL
+        ).exists()
+    return check
+
+
+def idempotent(scope):
+    """Decorador para vistas POST que crean algo y responden JSON."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if not KEY_PATTERN.fullmatch(key):
+                return JsonResponse({'error': f'{IDEMPOTENCY_HEADER} inválida'}, status=400)
+            request_hash = hashlib.sha256(request.body).hexdigest()
+            cutoff = timezone.now() - IDEMPOTENCY_TTL
+
+            # Camino del reintento: una lectura por el índice único.
+            stored = IdempotencyKey.objects.filter(
+                scope=scope, key=key, created_at__gte=cutoff
+            ).first()
+            if stored is not None:
+                return _replay(stored, request_hash)
+
+            with transaction.atomic():
+                IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+                try:
+                    with transaction.atomic():
+                        record = IdempotencyKey.objects.create(
+                            scope=scope, key=key, request_hash=request_hash
+                        )
+                except IntegrityError:
+                    # Otro reintento la insertó recién (y ya confirmó).
+                    return _replay(
+                        IdempotencyKey.objects.filter(scope=scope, key=key).first(), request_hash
+                    )
+
+                response = view(request, *args, **kwargs)
+                if not 200 <= response.status_code < 300:
+                    transaction.set_rollback(True)
+                    return response
+                record.status_code = response.status_code
+                record.response_body = response.content.decode()
+                record.save(update_fields=['status_code', 'response_body'])
+                return response
+        return wrapper
+    return decorator
@@ -0,0 +1,110 @@
+"""
+Management command: prueba de carga de las vistas de disponibilidad.
+
+Dispara pedidos concurrentes contra un servidor ya levantado (uvicorn) y
+reporta pedidos por segundo y latencias. Sirve para comparar el mismo tráfico
+antes y después de un cambio, por ejemplo vistas sync contra async.
+
+Uso:
+    python manage.py loadtest_availability --base-url http://localhost:8000
+    python manage.py loadtest_availability --concurrency 100 --requests 2000
+    python manage.py loadtest_availability --endpoints mes,slots --revalidate
+
+Con --revalidate cada cliente repite el ETag que recibió, como hace el
+navegador: mide el camino de los 304.
+"""
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+ENDPOINTS = {
+    'calendario': '/fractalia/calendario/',
+    'dias': '/fractalia/api/dias-disponibilidad/?resource_id={resource_id}&days=15&from_date={fecha}',
+    'slots': '/fractalia/api/disponibilidad/?resource_id={resource_id}&fecha={fecha}',
+    'mes': '/fractalia/api/mes-disponibilidad/?resource_id={resource_id}&month={mes}',
+}
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga de las vistas de disponibilidad contra un servidor levantado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--resource-id', type=int, default=1)
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Clientes simultáneos')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Pedidos en total por endpoint')
+        parser.add_argument('--endpoints', default='calendario,dias,slots,mes',
+                            help=f'Separados por coma: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--revalidate', action='store_true',
+                            help='Reenviar el ETag recibido (If-None-Match)')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['endpoints'].split(',') if n.strip()]
+        unknown = [n for n in names if n not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f'Endpoints desconocidos: {", ".join(unknown)}')
+
+        today = timezone.localdate()
+        params = {
+            'resource_id': options['resource_id'],
+            'fecha': (today + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'mes': today.strftime('%Y-%m'),
+        }
+
+        self.stdout.write(
+            f"{options['base_url']} · {options['concurrency']} clientes · "
+            f"{options['requests']} pedidos por endpoint"
+            f"{' · con If-None-Match' if options['revalidate'] else ''}"
+        )
+        for name in names:
+            url = options['base_url'].rstrip('/') + ENDPOINTS[name].format(**params)
+            self._run(name, url, options)
+
+    def _run(self, name, url, options):
+        etags = threading.local()
+        latencies, statuses, lock = [], {}, threading.Lock()
+
+        def one(_):
+            request = urllib.request.Request(url)
+            etag = getattr(etags, 'value', None)
+            if etag:
+                request.add_header('If-None-Match', etag)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+                    if options['revalidate']:
+                        etags.value = response.headers.get('ETag')
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(one, range(options['requests'])))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        status_str = ', '.join(f'{k}: {v}' for k, v in sorted(statuses.items(), key=str))
+        self.stdout.write(
+            f'{name:<11} {len(latencies) / wall:8.1f} req/s · '
+            f'p50 {cuts[49] * 1000:7.1f} ms · p95 {cuts[94] * 1000:7.1f} ms · '
+            f'p99 {cuts[98] * 1000:7.1f} ms · [{status_str}]'
+        )
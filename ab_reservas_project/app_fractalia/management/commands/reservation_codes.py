@@ -0,0 +1,34 @@
+"""
+Management command: uso del espacio de códigos de reserva.
+
+Los códigos salen de un contador pasado por una permutación (ver
+app_fractalia/codes.py); este comando dice cuántos se emitieron, cuántos
+venían de antes y cuánto queda.
+
+Uso:
+    python manage.py reservation_codes
+"""
+from django.core.management.base import BaseCommand
+
+from app_fractalia.models import reservation_code_usage
+
+# A partir de acá conviene pensar en códigos más largos.
+WARN_RATIO = 0.8
+
+
+class Command(BaseCommand):
+    help = 'Muestra cuánto del espacio de códigos de reserva está usado'
+
+    def handle(self, *args, **options):
+        usage = reservation_code_usage()
+        self.stdout.write(
+            f"Códigos usados: {usage['used']:,} de {usage['capacity']:,} "
+            f"({usage['used_ratio']:.2%})"
+        )
+        self.stdout.write(f"  emitidos por el contador: {usage['issued']:,}")
+        self.stdout.write(f"  anteriores al contador:   {usage['legacy']:,}")
+        self.stdout.write(f"  libres:                   {usage['free']:,}")
+        if usage['used_ratio'] >= WARN_RATIO:
+            self.stdout.write(self.style.WARNING(
+                'El espacio de códigos se está llenando: conviene ampliar CODE_LENGTH.'
+            ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:22
+
+from django.db import migrations, models
+
+
+def create_generation_row(apps, schema_editor):
+    BookingGeneration = apps.get_model('app_fractalia', 'BookingGeneration')
+    BookingGeneration.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0018_fractaboxpackage_duration_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField(default=0, verbose_name='Generación')),
+            ],
+            options={
+                'verbose_name': 'Generación de reservas',
+                'verbose_name_plural': 'Generación de reservas',
+            },
+        ),
+        migrations.RunPython(create_generation_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,115 @@
+"""
+Solapamiento de reservas confirmadas garantizado por la base (solo PostgreSQL).
+
+Agrega a app_fractalia_booking una columna generada `period` (tstzrange
+semiabierto [inicio, fin)) y una restricción de exclusión GiST que impide que
+dos reservas CONFIRMED se pisen. El índice GiST de la restricción es el que
+usan las consultas de solapamiento (BookingQuerySet.confirmed_overlapping).
+
+La columna no es un campo del modelo: la calcula la base y Django nunca la
+escribe. En SQLite la migración no hace nada y el chequeo queda en clean().
+
+Hasta acá el único control era clean(), que el admin y los caminos directos
+podían saltarse. Si la base ya tiene reservas confirmadas que se pisan (o una
+que termina antes de empezar), la migración se detiene antes de tocar la tabla
+y lista cuáles son: hay que resolverlas a mano (cancelar o mover una de cada
+par) y volver a migrar. No se elige sola cuál cancelar.
+"""
+from datetime import timezone as dt_timezone
+import zoneinfo
+
+from django.db import migrations
+
+ASUNCION = zoneinfo.ZoneInfo('America/Asuncion')
+
+FORWARD_SQL = [
+    """
+    ALTER TABLE app_fractalia_booking
+    ADD COLUMN period tstzrange
+    GENERATED ALWAYS AS (tstzrange(start_datetime, end_datetime, '[)')) STORED
+    """,
+    """
+    ALTER TABLE app_fractalia_booking
+    ADD CONSTRAINT booking_confirmed_no_overlap
+    EXCLUDE USING gist (period WITH &&) WHERE (status = 'CONFIRMED')
+    """,
+]
+
+REVERSE_SQL = [
+    "ALTER TABLE app_fractalia_booking DROP CONSTRAINT IF EXISTS booking_confirmed_no_overlap",
+    "ALTER TABLE app_fractalia_booking DROP COLUMN IF EXISTS period",
+]
+
+
+OVERLAPS_SQL = """
+    SELECT a.id, a.reservation_code, a.client_name, a.start_datetime, a.end_datetime,
+           b.id, b.reservation_code, b.client_name, b.start_datetime, b.end_datetime
+    FROM app_fractalia_booking a
+    JOIN app_fractalia_booking b
+      ON a.id < b.id AND a.start_datetime < b.end_datetime AND b.start_datetime < a.end_datetime
+    WHERE a.status = 'CONFIRMED' AND b.status = 'CONFIRMED'
+    ORDER BY a.start_datetime, a.id, b.id
+"""
+
+INVERTED_SQL = """
+    SELECT id, reservation_code, client_name, start_datetime, end_datetime
+    FROM app_fractalia_booking
+    WHERE end_datetime < start_datetime
+    ORDER BY start_datetime, id
+"""
+
+
+def _local(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(ASUNCION)
+
+
+def _booking_str(pk, code, client, start, end):
+    start, end = _local(start), _local(end)
+    return f'#{pk} [{code or "sin código"}] {client or "sin nombre"} {start:%Y-%m-%d %H:%M}–{end:%H:%M}'
+
+
+def booking_conflicts(connection):
+    """Líneas legibles con lo que impide crear la restricción; vacío si nada."""
+    problems = []
+    with connection.cursor() as cursor:
+        cursor.execute(INVERTED_SQL)
+        for row in cursor.fetchall():
+            problems.append(f'  termina antes de empezar: {_booking_str(*row)}')
+        cursor.execute(OVERLAPS_SQL)
+        for row in cursor.fetchall():
+            problems.append(f'  se pisan: {_booking_str(*row[:5])}  ↔  {_booking_str(*row[5:])}')
+    return problems
+
+
+def add_period_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    problems = booking_conflicts(schema_editor.connection)
+    if problems:
+        raise RuntimeError(
+            'No se puede crear booking_confirmed_no_overlap: hay reservas que la violan.\n'
+            + '\n'.join(problems)
+            + '\nCancelá o mové una de cada par desde el admin y volvé a correr migrate.'
+        )
+    for sql in FORWARD_SQL:
+        schema_editor.execute(sql)
+
+
+def remove_period_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in REVERSE_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0019_booking_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_period_exclusion, remove_period_exclusion),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0020_booking_period_exclusion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_id', models.IntegerField(blank=True, null=True, verbose_name='Recurso')),
+                ('date', models.DateField(blank=True, null=True, verbose_name='Día')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creado')),
+            ],
+            options={
+                'verbose_name': 'Cambio de disponibilidad',
+                'verbose_name_plural': 'Cambios de disponibilidad',
+            },
+        ),
+    ]
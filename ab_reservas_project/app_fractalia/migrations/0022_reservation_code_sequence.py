@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:42
+"""
+Contador de códigos de reserva (app_fractalia/codes.py).
+
+Crea la fila única de ReservationCodeSequence con los códigos que ya existen,
+para que el contador no los repita, y en PostgreSQL la secuencia que hace de
+contador.
+"""
+from django.db import migrations, models
+
+SEQUENCE = 'app_fractalia_reservation_code_seq'
+
+
+def create_sequence(apps, schema_editor):
+    Booking = apps.get_model('app_fractalia', 'Booking')
+    PendingBooking = apps.get_model('app_fractalia', 'PendingBooking')
+    ReservationCodeSequence = apps.get_model('app_fractalia', 'ReservationCodeSequence')
+
+    existing = set(PendingBooking.objects.values_list('reservation_code', flat=True))
+    existing.update(
+        Booking.objects.exclude(reservation_code=None).values_list('reservation_code', flat=True)
+    )
+    existing.discard('')
+    ReservationCodeSequence.objects.update_or_create(
+        pk=1, defaults={'legacy_codes': ' '.join(sorted(existing))}
+    )
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} MINVALUE 0 START 0')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0021_availability_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued', models.PositiveIntegerField(default=0, verbose_name='Emitidos')),
+                ('legacy_codes', models.TextField(blank=True, default='', verbose_name='Códigos anteriores')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de códigos de reserva',
+                'verbose_name_plural': 'Secuencia de códigos de reserva',
+            },
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:46
+"""
+Booking.pending_booking: la pre-reserva de la que salió cada reserva.
+
+Hasta ahora el vínculo era el código, en reservation_code o escrito en notes
+("Código de reserva: XXXX", "... Código: XXXX"), y se buscaba con LIKE. La
+migración completa el campo con las reservas que ya existen; si dos reservas
+apuntan a la misma pre-reserva, queda la más nueva.
+"""
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CODE_IN_NOTES = re.compile(r'Código(?: de reserva)?: (\w{4})')
+
+
+def link_pending_bookings(apps, schema_editor):
+    Booking = apps.get_model('app_fractalia', 'Booking')
+    PendingBooking = apps.get_model('app_fractalia', 'PendingBooking')
+
+    pending_by_code = dict(PendingBooking.objects.values_list('reservation_code', 'id'))
+    linked, to_update = set(), []
+    for booking in Booking.objects.filter(pending_booking=None).order_by('-created_at', '-id'):
+        code = booking.reservation_code
+        if not code:
+            match = CODE_IN_NOTES.search(booking.notes or '')
+            code = match.group(1) if match else None
+        pending_id = pending_by_code.get(code)
+        if pending_id and pending_id not in linked:
+            linked.add(pending_id)
+            booking.pending_booking_id = pending_id
+            to_update.append(booking)
+    Booking.objects.bulk_update(to_update, ['pending_booking'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0022_reservation_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='pending_booking',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='booking', to='app_fractalia.pendingbooking', verbose_name='Pre-reserva'),
+        ),
+        migrations.RunPython(link_pending_bookings, migrations.RunPython.noop),
+    ]
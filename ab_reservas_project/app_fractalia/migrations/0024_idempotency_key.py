@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0023_booking_pending_booking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, verbose_name='Endpoint')),
+                ('key', models.CharField(max_length=64, verbose_name='Clave')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='Hash del pedido')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Código HTTP')),
+                ('response_body', models.TextField(blank=True, default='', verbose_name='Respuesta')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creada')),
+            ],
+            options={
+                'verbose_name': 'Clave de idempotencia',
+                'verbose_name_plural': 'Claves de idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='idempotency_scope_key_unique')],
+            },
+        ),
+    ]
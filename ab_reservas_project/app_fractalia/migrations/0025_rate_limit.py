@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0024_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Clave')),
+                ('tokens', models.FloatField(verbose_name='Tokens')),
+                ('updated_at', models.FloatField(db_index=True, verbose_name='Actualizado')),
+                ('allowed', models.BooleanField(default=True, verbose_name='Último pedido admitido')),
+            ],
+            options={
+                'verbose_name': 'Balde de rate limit',
+                'verbose_name_plural': 'Baldes de rate limit',
+            },
+        ),
+        migrations.CreateModel(
+            name='RateLimitStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50, unique=True, verbose_name='Endpoint')),
+                ('shed', models.PositiveBigIntegerField(default=0, verbose_name='Rechazados')),
+                ('last_shed_at', models.DateTimeField(blank=True, null=True, verbose_name='Último rechazo')),
+            ],
+            options={
+                'verbose_name': 'Rechazos por rate limit',
+                'verbose_name_plural': 'Rechazos por rate limit',
+            },
+        ),
+    ]
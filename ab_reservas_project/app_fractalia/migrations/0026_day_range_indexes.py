@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0025_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creada'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='start_datetime',
+            field=models.DateTimeField(db_index=True, verbose_name='Inicio'),
+        ),
+        migrations.AlterField(
+            model_name='pendingbooking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Recibida'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:15
+"""
+La clave de los códigos de reserva pasa de settings a ReservationCodeSequence.
+
+Antes salía de RESERVATION_CODE_KEY, que por defecto era SECRET_KEY: rotar la
+SECRET_KEY cambiaba la permutación y los códigos nuevos podían chocar con los
+ya emitidos. Si el contador ya se usó, se guarda la clave que estaba en uso
+(la misma derivación de antes), así la secuencia sigue igual; si no, se
+sortea una nueva.
+"""
+import hashlib
+import os
+import secrets
+
+from django.conf import settings
+from django.db import migrations, models
+
+SEQUENCE = 'app_fractalia_reservation_code_seq'
+
+
+def _issued(ReservationCodeSequence, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'SELECT is_called FROM {SEQUENCE}')
+            return cursor.fetchone()[0]
+    return ReservationCodeSequence.objects.filter(pk=1, issued__gt=0).exists()
+
+
+def store_key(apps, schema_editor):
+    ReservationCodeSequence = apps.get_model('app_fractalia', 'ReservationCodeSequence')
+    ReservationCodeSequence.objects.get_or_create(pk=1)
+    if _issued(ReservationCodeSequence, schema_editor):
+        old = os.environ.get('RESERVATION_CODE_KEY', settings.SECRET_KEY)
+        key = hashlib.sha256(b'app_fractalia.codes:' + old.encode()).hexdigest()
+    else:
+        key = secrets.token_hex(32)
+    ReservationCodeSequence.objects.filter(pk=1, key='').update(key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_fractalia', '0026_day_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservationcodesequence',
+            name='key',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Clave'),
+        ),
+        migrations.RunPython(store_key, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.expressions import RawSQL
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from datetime import datetime, timedelta
-import random
-import string
+import secrets
+
+from . import codes
 
 
 class Resource(models.Model):
@@ -83,6 +86,37 @@ class FractaboxPackage(models.Model):
         return f'{self.product.name} - {self.label}'
 
 
+# Restricción de exclusión GiST sobre `period` (ver migración 0020). Solo existe
+# en PostgreSQL; en SQLite el solapamiento lo sigue cuidando Booking.clean().
+OVERLAP_CONSTRAINT = 'booking_confirmed_no_overlap'
+
+
+class BookingQuerySet(models.QuerySet):
+    def confirmed_overlapping(self, start, end):
+        """
+        Reservas CONFIRMADAS que pisan [start, end), de cualquier recurso.
+
+        En PostgreSQL usa el operador && sobre la columna generada `period`,
+        que es la que indexa la restricción de exclusión. En SQLite queda la
+        comparación de siempre sobre start/end.
+        """
+        qs = self.filter(status='CONFIRMED')
+        if connections[self.db].vendor != 'postgresql':
+            return qs.filter(start_datetime__lt=end, end_datetime__gt=start)
+
+        # RawSQL no pasa por la conversión de zona de la ORM: un naive se
+        # interpreta en la zona del proyecto, igual que en un filter().
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        return qs.filter(RawSQL(
+            f"{self.model._meta.db_table}.period && tstzrange(%s, %s, '[)')",
+            (start, end),
+            output_field=models.BooleanField(),
+        ))
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('CONFIRMED', 'Confirmada'),
@@ -98,14 +132,20 @@ class Booking(models.Model):
         FractaboxPackage, on_delete=models.SET_NULL, null=True, blank=True,
         related_name='bookings', verbose_name='Paquete Fractabox'
     )
+    pending_booking = models.OneToOneField(
+        'PendingBooking', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='booking', verbose_name='Pre-reserva'
+    )
     reservation_code = models.CharField(max_length=4, unique=True, null=True, blank=True, verbose_name='Código')
     client_name = models.CharField(max_length=100, blank=True, verbose_name='Cliente')
-    start_datetime = models.DateTimeField(verbose_name='Inicio')
+    start_datetime = models.DateTimeField(db_index=True, verbose_name='Inicio')
     end_datetime = models.DateTimeField(verbose_name='Fin')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='CONFIRMED', verbose_name='Estado')
     notes = models.TextField(blank=True, verbose_name='Notas')
     client_phone = models.CharField(max_length=20, blank=True, default='', verbose_name='Teléfono del cliente')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Creada')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creada')
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Reserva'
@@ -123,11 +163,7 @@ class Booking(models.Model):
 
         if self.status == 'CONFIRMED':
             # Cross-resource: el espacio físico es uno solo
-            overlapping = Booking.objects.filter(
-                status='CONFIRMED',
-                start_datetime__lt=self.end_datetime,
-                end_datetime__gt=self.start_datetime
-            )
+            overlapping = Booking.objects.confirmed_overlapping(self.start_datetime, self.end_datetime)
             if self.id:
                 overlapping = overlapping.exclude(id=self.id)
 
@@ -156,22 +192,175 @@ class Booking(models.Model):
                         f'No hay horario disponible configurado para {day_name}.'
                     )
 
-    def save(self, *args, skip_availability_check=False, **kwargs):
+    def save(self, *args, skip_availability_check=False, checked=False, **kwargs):
         self._skip_availability_check = skip_availability_check
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # checked: quien llama ya validó bajo lock (app_fractalia/confirmation.py).
+        if not checked:
+            self.full_clean()
+        # clean() es chequear-y-después-insertar: dos confirmaciones simultáneas
+        # pueden pasarlo las dos. En PostgreSQL la que llega segunda choca con la
+        # restricción de exclusión y se reporta igual que el chequeo de clean().
+        try:
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if OVERLAP_CONSTRAINT in str(e):
+                raise ValidationError('Este horario ya está ocupado por otra reserva.')
+            raise
+
+
+class BookingGeneration(models.Model):
+    """
+    Contador global de cambios que afectan la disponibilidad del calendario.
+
+    Una sola fila (pk=1) que sube con cada alta, cambio o baja de Booking y del
+    horario semanal, venga del calendario, del admin o del MCP. Es la versión
+    que llevan las claves de caché y los ETag de las APIs de disponibilidad.
+    """
+    generation = models.PositiveBigIntegerField(default=0, verbose_name='Generación')
+
+    class Meta:
+        verbose_name = 'Generación de reservas'
+        verbose_name_plural = 'Generación de reservas'
+
+    def __str__(self):
+        return f'Generación {self.generation}'
+
+
+class AvailabilityChange(models.Model):
+    """
+    Qué días cambiaron, para el stream SSE del calendario (app_fractalia/events.py).
+
+    Cada alta, cambio o baja de Booking deja una fila por día local que tocaba
+    antes o después del cambio. date vacío quiere decir "todos los días": cambió
+    el horario semanal o el recurso. Las filas viven poco (CHANGE_RETENTION):
+    solo sirven para que un stream abierto o recién reconectado se ponga al día.
+    """
+    resource_id = models.IntegerField(null=True, blank=True, verbose_name='Recurso')
+    date = models.DateField(null=True, blank=True, verbose_name='Día')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creado')
+
+    class Meta:
+        verbose_name = 'Cambio de disponibilidad'
+        verbose_name_plural = 'Cambios de disponibilidad'
+
+    def __str__(self):
+        return f'{self.date or "todos los días"} (recurso {self.resource_id})'
+
+
+class ReservationCodeSequence(models.Model):
+    """
+    Contador de códigos de reserva (ver app_fractalia/codes.py).
+
+    Una sola fila (pk=1). En PostgreSQL el contador es la secuencia
+    RESERVATION_CODE_SEQUENCE, que no bloquea ni vuelve atrás con un rollback;
+    en SQLite es el campo issued. legacy_codes guarda los códigos que ya
+    existían antes del contador, para no volver a darlos. key es la clave de
+    la permutación, en hex: vive acá y no en settings para que rotar
+    SECRET_KEY no cambie los códigos.
+    """
+    issued = models.PositiveIntegerField(default=0, verbose_name='Emitidos')
+    legacy_codes = models.TextField(blank=True, default='', verbose_name='Códigos anteriores')
+    key = models.CharField(max_length=64, blank=True, default='', verbose_name='Clave')
+
+    class Meta:
+        verbose_name = 'Secuencia de códigos de reserva'
+        verbose_name_plural = 'Secuencia de códigos de reserva'
+
+    def __str__(self):
+        return f'Códigos emitidos: {self.issued}'
+
+
+RESERVATION_CODE_SEQUENCE = 'app_fractalia_reservation_code_seq'
+
+# La clave y los números del contador que caen en un código anterior no
+# cambian después de la migración, así que cada proceso los lee una vez.
+_code_key = None
+_legacy_code_indexes = None
+
+
+def _reservation_code_key():
+    global _code_key
+    if _code_key is None:
+        ReservationCodeSequence.objects.get_or_create(pk=1)
+        # Base nueva sin la migración 0027 corrida sobre una fila: se sortea una
+        # vez, y si otro proceso ganó, vale la suya.
+        ReservationCodeSequence.objects.filter(pk=1, key='').update(key=secrets.token_hex(32))
+        _code_key = bytes.fromhex(
+            ReservationCodeSequence.objects.values_list('key', flat=True).get(pk=1)
+        )
+    return _code_key
+
+
+def _legacy_indexes():
+    global _legacy_code_indexes
+    if _legacy_code_indexes is None:
+        key = _reservation_code_key()
+        raw = (ReservationCodeSequence.objects.filter(pk=1)
+               .values_list('legacy_codes', flat=True).first() or '')
+        _legacy_code_indexes = frozenset(
+            codes.index_of(code, key) for code in raw.split() if codes.is_valid(code)
+        )
+    return _legacy_code_indexes
+
+
+def _next_code_number():
+    """Siguiente número del contador, en una sola consulta."""
+    connection = connections[ReservationCodeSequence.objects.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT nextval(%s)', [RESERVATION_CODE_SEQUENCE])
+            return cursor.fetchone()[0]
+        table = connection.ops.quote_name(ReservationCodeSequence._meta.db_table)
+        cursor.execute(f'UPDATE {table} SET issued = issued + 1 WHERE id = 1 RETURNING issued')
+        row = cursor.fetchone()
+    if row is None:
+        ReservationCodeSequence.objects.get_or_create(pk=1)
+        return _next_code_number()
+    return row[0] - 1
+
+
+def issued_code_count():
+    """Cuántos números del contador se usaron."""
+    connection = connections[ReservationCodeSequence.objects.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT last_value, is_called FROM {RESERVATION_CODE_SEQUENCE}')
+            last_value, is_called = cursor.fetchone()
+        return last_value + 1 if is_called else last_value
+    return ReservationCodeSequence.objects.filter(pk=1).values_list('issued', flat=True).first() or 0
 
 
 def generate_reservation_code():
-    """Generate a unique 4-character alphanumeric code (uppercase)"""
-    chars = string.ascii_uppercase + string.digits
+    """
+    Código de reserva único de 4 caracteres (A-Z0-9), sin reintentos: el
+    siguiente número del contador pasado por la permutación de codes.py. Solo
+    se saltean los números que caen en un código anterior al contador.
+    """
+    legacy = _legacy_indexes()
+    key = _reservation_code_key()
     while True:
-        code = ''.join(random.choices(chars, k=4))
-        if (
-            not PendingBooking.objects.filter(reservation_code=code).exists()
-            and not Booking.objects.filter(reservation_code=code).exists()
-        ):
-            return code
+        n = _next_code_number()
+        if n >= codes.CODE_SPACE:
+            raise RuntimeError('Se agotaron los códigos de reserva.')
+        if n not in legacy:
+            return codes.code_for(n, key)
+
+
+def reservation_code_usage():
+    """Cuánto del espacio de códigos está ocupado."""
+    legacy = _legacy_indexes()
+    issued = issued_code_count()
+    from_counter = issued - sum(1 for n in legacy if n < issued)
+    used = from_counter + len(legacy)
+    return {
+        'capacity': codes.CODE_SPACE,
+        'issued': from_counter,
+        'legacy': len(legacy),
+        'used': used,
+        'free': codes.CODE_SPACE - used,
+        'used_ratio': used / codes.CODE_SPACE,
+    }
 
 
 def get_fractabox_package_for_hours(product, hours):
@@ -209,7 +398,7 @@ class PendingBooking(models.Model):
     client_phone = models.CharField(max_length=20, blank=True, default='', verbose_name='Teléfono del cliente')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING', verbose_name='Estado')
     notes = models.TextField(blank=True, verbose_name='Notas')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Recibida')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Recibida')
 
     class Meta:
         verbose_name = 'Reserva pendiente'
@@ -218,3 +407,65 @@ class PendingBooking(models.Model):
 
     def __str__(self):
         return f'{self.reservation_code} - {self.resource.name} ({self.status})'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Respuesta ya dada a un POST con Idempotency-Key (ver app_fractalia/idempotency.py).
+
+    Si el cliente reintenta con la misma clave, recibe esta respuesta en vez
+    de crear otra pre-reserva. request_hash es el sha256 del cuerpo: la misma
+    clave con otros datos es un error del cliente. Las filas viven
+    IDEMPOTENCY_TTL y se purgan solas.
+    """
+    scope = models.CharField(max_length=50, verbose_name='Endpoint')
+    key = models.CharField(max_length=64, verbose_name='Clave')
+    request_hash = models.CharField(max_length=64, verbose_name='Hash del pedido')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Código HTTP')
+    response_body = models.TextField(blank=True, default='', verbose_name='Respuesta')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creada')
+
+    class Meta:
+        verbose_name = 'Clave de idempotencia'
+        verbose_name_plural = 'Claves de idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_scope_key_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}: {self.key}'
+
+
+class RateLimitBucket(models.Model):
+    """
+    Balde de tokens de un cliente en un endpoint (ver app_fractalia/ratelimit.py).
+
+    Vive en la base para que los workers de uvicorn compartan el mismo límite;
+    cada pedido lo lee y lo actualiza en una sola sentencia atómica. key es
+    "<scope>:<hash del cliente>"; los tiempos van en segundos epoch.
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name='Clave')
+    tokens = models.FloatField(verbose_name='Tokens')
+    updated_at = models.FloatField(db_index=True, verbose_name='Actualizado')
+    allowed = models.BooleanField(default=True, verbose_name='Último pedido admitido')
+
+    class Meta:
+        verbose_name = 'Balde de rate limit'
+        verbose_name_plural = 'Baldes de rate limit'
+
+    def __str__(self):
+        return self.key
+
+
+class RateLimitStat(models.Model):
+    """Pedidos rechazados por el rate limit, por endpoint."""
+    scope = models.CharField(max_length=50, unique=True, verbose_name='Endpoint')
+    shed = models.PositiveBigIntegerField(default=0, verbose_name='Rechazados')
+    last_shed_at = models.DateTimeField(null=True, blank=True, verbose_name='Último rechazo')
+
+    class Meta:
+        verbose_name = 'Rechazos por rate limit'
+        verbose_name_plural = 'Rechazos por rate limit'
+
+    def __str__(self):
+        return f'{self.scope}: {self.shed}'
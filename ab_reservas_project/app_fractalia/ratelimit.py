@@ -0,0 +1,110 @@
+"""
+Rate limit compartido entre workers: balde de tokens en la base.
+
+Cada cliente (IP o usuario) tiene, por endpoint, un balde de `limit` tokens
+que se rellena a razón de limit / window por segundo; cada pedido gasta uno.
+Es una ventana deslizante sin saltos: nunca pasan más de `limit` pedidos
+seguidos, y el ritmo sostenido es `limit` por ventana.
+
+El balde se lee, se rellena y se descuenta en una sola sentencia
+(INSERT ... ON CONFLICT DO UPDATE ... RETURNING), así que dos workers no
+pueden gastar el mismo token. Funciona igual en PostgreSQL y en SQLite.
+
+Los rechazos se cuentan por endpoint en RateLimitStat (se ven en el admin).
+Los baldes quietos se borran de a ratos.
+"""
+import hashlib
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import RateLimitBucket, RateLimitStat
+
+# Baldes sin uso hace más de esto se borran; se purga en uno de cada
+# PRUNE_EVERY pedidos, al azar.
+IDLE_SECONDS = 60 * 60
+PRUNE_EVERY = 200
+
+
+def client_ip(request):
+    """
+    IP del cliente según el primero de nuestros proxies (settings.PROXY_HOPS),
+    contando X-Forwarded-For desde la derecha. Las entradas de más a la
+    izquierda las puede poner el cliente: rotándolas se saltaría el límite.
+    """
+    hops = settings.PROXY_HOPS
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if hops > 0 and forwarded:
+        return forwarded[-min(hops, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '0.0.0.0')
+
+
+def _upsert_sql(limit, window_seconds):
+    table = connection.ops.quote_name(RateLimitBucket._meta.db_table)
+    least = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+    capacity = float(limit)
+    rate = float(limit) / float(window_seconds)
+    # En el SET todas las expresiones ven la fila anterior.
+    available = f'{least}({capacity!r}, {table}.tokens + (excluded.updated_at - {table}.updated_at) * {rate!r})'
+    return (
+        f'INSERT INTO {table} (key, tokens, updated_at, allowed) VALUES (%s, %s, %s, TRUE) '
+        f'ON CONFLICT (key) DO UPDATE SET '
+        f'tokens = CASE WHEN {available} >= 1 THEN {available} - 1 ELSE {available} END, '
+        f'allowed = {available} >= 1, '
+        f'updated_at = excluded.updated_at '
+        f'RETURNING allowed'
+    )
+
+
+def _record_shed(scope):
+    updated = RateLimitStat.objects.filter(scope=scope).update(
+        shed=F('shed') + 1, last_shed_at=timezone.now()
+    )
+    if not updated:
+        stat, created = RateLimitStat.objects.get_or_create(
+            scope=scope, defaults={'shed': 1, 'last_shed_at': timezone.now()}
+        )
+        if not created:
+            RateLimitStat.objects.filter(pk=stat.pk).update(shed=F('shed') + 1)
+
+
+def allow(scope, identity, limit, window_seconds):
+    """True si el pedido entra; False si hay que rechazarlo (y lo cuenta)."""
+    now = time.time()
+    key = f'{scope}:{hashlib.sha256(identity.encode()).hexdigest()[:32]}'
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(limit, window_seconds), [key, float(limit) - 1, now])
+        allowed = bool(cursor.fetchone()[0])
+    if random.randrange(PRUNE_EVERY) == 0:
+        RateLimitBucket.objects.filter(updated_at__lt=now - IDLE_SECONDS).delete()
+    if not allowed:
+        _record_shed(scope)
+    return allowed
+
+
+def rate_limited(scope, limit, window_seconds, identity=client_ip, skip=None):
+    """
+    Decorador para vistas JSON: responde 429 con Retry-After cuando el cliente
+    se queda sin tokens. `identity(request)` dice quién es el cliente; si
+    `skip(request)` da True, el pedido pasa sin gastar.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if skip is not None and skip(request):
+                return view(request, *args, **kwargs)
+            if not allow(scope, identity(request), limit, window_seconds):
+                response = JsonResponse(
+                    {'error': 'Demasiados pedidos. Probá de nuevo en un momento.'}, status=429
+                )
+                response['Retry-After'] = str(max(1, round(window_seconds / limit)))
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
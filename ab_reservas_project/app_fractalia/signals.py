@@ -0,0 +1,72 @@
+"""
+Todo lo que cambia la disponibilidad sube la generación global de reservas y
+deja asentado qué días tocó, para el stream SSE del calendario (events.py).
+
+Se engancha a los signals del modelo y no a cada vista, así que cubre por igual
+el calendario público, las acciones del admin y los tools del MCP.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_booking_generation
+from .events import booking_dates, record_availability_change
+from .models import Booking, FractaboxPackage, Product, Resource, WeeklyAvailability
+
+
+@receiver(pre_save, sender=Booking)
+def _remember_booking_period(sender, instance, raw=False, **kwargs):
+    # Si la reserva se movió, también cambió el día donde estaba antes.
+    instance._period_before = None
+    if instance.pk and not raw:
+        instance._period_before = (
+            Booking.objects.filter(pk=instance.pk)
+            .values_list('start_datetime', 'end_datetime').first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def _booking_changed(sender, instance, **kwargs):
+    dates = set()
+    for period in ((instance.start_datetime, instance.end_datetime),
+                   instance.__dict__.pop('_period_before', None)):
+        if period and period[0] and period[1]:
+            dates.update(booking_dates(*period))
+    record_availability_change(instance.resource_id, dates)
+    bump_booking_generation()
+
+
+@receiver(post_save, sender=WeeklyAvailability)
+@receiver(post_delete, sender=WeeklyAvailability)
+def _schedule_changed(sender, instance, **kwargs):
+    record_availability_change(instance.resource_id)
+    bump_booking_generation()
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def _resource_changed(sender, instance, **kwargs):
+    record_availability_change(instance.pk)
+    bump_booking_generation()
+
+
+# Los productos y paquetes Fractabox definen cuánto dura un turno y cuántos
+# slots bloquea: cambian los huecos libres aunque no cambie ninguna reserva.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _product_changed(sender, instance, **kwargs):
+    record_availability_change(instance.resource_id)
+    bump_booking_generation()
+
+
+@receiver(post_save, sender=FractaboxPackage)
+@receiver(post_delete, sender=FractaboxPackage)
+def _package_changed(sender, instance, **kwargs):
+    # En un borrado en cascada el producto puede no estar ya: sin recurso, el
+    # cambio vale para todos.
+    resource_id = (
+        Product.objects.filter(pk=instance.product_id)
+        .values_list('resource_id', flat=True).first()
+    )
+    record_availability_change(resource_id)
+    bump_booking_generation()
@@ -9,6 +9,22 @@ urlpatterns = [
         views.dias_disponibilidad_api,
         name='fractalia_dias_disponibilidad_api',
     ),
+    path(
+        'api/mes-disponibilidad/',
+        views.mes_disponibilidad_api,
+        name='fractalia_mes_disponibilidad_api',
+    ),
+    path('api/huecos-libres/', views.huecos_libres_api, name='fractalia_huecos_libres_api'),
+    path(
+        'api/eventos-disponibilidad/',
+        views.eventos_disponibilidad,
+        name='fractalia_eventos_disponibilidad',
+    ),
+    path(
+        'api/disponibilidad-lote/',
+        views.disponibilidad_lote_api,
+        name='fractalia_disponibilidad_lote_api',
+    ),
     path(
         'api/reserva-pendiente/',
         views.create_pending_booking,
@@ -1,18 +1,32 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Prefetch
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
 import json
 import re
 from .models import (
-    Resource, WeeklyAvailability, Booking, PendingBooking, Product, FractaboxPackage,
+    Resource, Booking, PendingBooking, Product, FractaboxPackage,
     generate_reservation_code, get_fractabox_package_for_hours, get_fractabox_package_for_minutes,
 )
+from .availability import (
+    ASUNCION, MAX_BATCH_CANDIDATES, MAX_FREE_WINDOWS, MAX_WINDOW_DAYS, afind_free_windows,
+    aget_day_slots, aget_days_overview, aget_month_grid, check_candidates,
+    default_window_minutes, fractabox_slots_needed, get_day_slots, mark_available_as_start,
+)
+from .cache import aavailability_response
+from .confirmation import confirm_pending_booking
+from .events import availability_events
+from .idempotency import has_stored_key, idempotent
+from .ratelimit import client_ip, rate_limited
 
 
-def calendario(request):
+async def calendario(request):
+    # El template lee request.user; se resuelve acá con la API async para que
+    # no dispare una consulta sync desde el loop.
+    request.user = await request.auser()
     if request.user.is_staff:
         products_qs = Product.objects.filter(is_active=True)
     else:
@@ -22,7 +36,7 @@ def calendario(request):
         Prefetch('packages', queryset=FractaboxPackage.objects.filter(is_active=True).order_by('order'))
     ).select_related('resource')
 
-    products_list = list(products_qs)
+    products_list = [p async for p in products_qs]
     products_json = json.dumps([{
         'id': p.id,
         'name': p.name,
@@ -50,78 +64,19 @@ def calendario(request):
     return render(request, 'app_fractalia/calendario.html', context)
 
 
+# Versiones sync: las usa el MCP, que no corre en un loop async.
 def _get_slots_for_date(resource, fecha):
     """Helper function to get slots for a specific date"""
-    weekday = fecha.weekday()
-    availability = WeeklyAvailability.objects.filter(
-        resource=resource,
-        weekday=weekday
-    ).first()
-
-    if not availability:
-        return None
-
-    start_hour = availability.start_time.hour
-    end_hour = availability.end_time.hour
-
-    if availability.end_time.minute > 0:
-        end_hour += 1
-
-    slots = []
-    current_hour = start_hour
-
-    while current_hour < end_hour:
-        slot_start_time = time(hour=current_hour, minute=0)
-        slot_end_time = time(hour=current_hour + 1, minute=0) if current_hour + 1 <= 23 else time(23, 59)
-
-        slot_start_datetime = datetime.combine(fecha, slot_start_time)
-        slot_end_datetime = datetime.combine(fecha, slot_end_time)
-
-        # Check across ALL resources — only one resource can be booked at a time
-        overlapping_booking = Booking.objects.filter(
-            status='CONFIRMED',
-            start_datetime__lt=slot_end_datetime,
-            end_datetime__gt=slot_start_datetime
-        ).exists()
-
-        is_available = not overlapping_booking
-
-        slots.append({
-            'time': slot_start_time.strftime('%H:%M'),
-            'available': is_available,
-            'display': slot_start_time.strftime('%H:%M'),
-        })
-
-        current_hour += 1
-
-    return slots
+    return get_day_slots(resource, fecha)
 
 
 def _get_slots_for_date_staff(resource, fecha):
-    """Slots para admins: cubre el día completo (6-23h) sin restricción de WeeklyAvailability."""
-    slots = []
-    for current_hour in range(5, 23):
-        slot_start_time = time(hour=current_hour, minute=0)
-        slot_end_time = time(hour=current_hour + 1, minute=0)
-        slot_start_datetime = datetime.combine(fecha, slot_start_time)
-        slot_end_datetime = datetime.combine(fecha, slot_end_time)
-
-        overlapping_booking = Booking.objects.filter(
-            status='CONFIRMED',
-            start_datetime__lt=slot_end_datetime,
-            end_datetime__gt=slot_start_datetime
-        ).exists()
-
-        slots.append({
-            'time': slot_start_time.strftime('%H:%M'),
-            'available': not overlapping_booking,
-            'display': slot_start_time.strftime('%H:%M'),
-        })
-    return slots
+    """Slots para admins: cubre el día completo (5-23h) sin restricción de WeeklyAvailability."""
+    return get_day_slots(resource, fecha, staff=True)
 
 
 @require_http_methods(['GET'])
-def disponibilidad_api(request):
+async def disponibilidad_api(request):
     fecha_str = request.GET.get('fecha')
     resource_id = request.GET.get('resource_id')
     product_type = request.GET.get('product_type', '')
@@ -135,55 +90,54 @@ def disponibilidad_api(request):
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha inválido (use YYYY-MM-DD)'}, status=400)
 
-    try:
-        resource = Resource.objects.get(id=resource_id, active=True)
-    except Resource.DoesNotExist:
-        return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
+    # Para FRACTABOX: available_as_start se calcula sobre los slots ya marcados,
+    # sin volver a consultar reservas
+    slots_needed = None
+    if product_type == 'FRACTABOX' and slots_needed_str:
+        try:
+            slots_to_block = int(slots_needed_str)
+        except ValueError:
+            slots_to_block = 1
+        try:
+            duration_minutes = int(request.GET.get('duration_minutes') or 0) or None
+        except ValueError:
+            duration_minutes = None
+        slots_needed = fractabox_slots_needed(slots_to_block, duration_minutes)
 
-    staff_mode = request.GET.get('staff_mode') == 'true' and request.user.is_staff
+    staff_mode = request.GET.get('staff_mode') == 'true' and (await request.auser()).is_staff
 
-    if staff_mode:
-        slots = _get_slots_for_date_staff(resource, fecha)
-    else:
-        slots = _get_slots_for_date(resource, fecha)
+    async def compute():
+        try:
+            resource = await Resource.objects.aget(id=resource_id, active=True)
+        except Resource.DoesNotExist:
+            return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
+
+        slots = await aget_day_slots(resource, fecha, staff=staff_mode)
+
+        if slots is None:
+            return JsonResponse({
+                'slots': [],
+                'message': 'No hay horario disponible para este día'
+            })
+
+        if slots_needed is not None:
+            mark_available_as_start(slots, slots_needed)
 
-    if slots is None:
         return JsonResponse({
-            'slots': [],
-            'message': 'No hay horario disponible para este día'
+            'slots': slots,
+            'fecha': fecha.strftime('%Y-%m-%d'),
+            'resource_id': resource.id,
+            'resource_name': resource.name,
+            'has_availability': any(s['available'] for s in slots),
         })
 
-    # Para FRACTABOX: calcular available_as_start usando duración real en minutos
-    if product_type == 'FRACTABOX' and slots_needed_str:
-        try:
-            slots_needed = int(slots_needed_str)
-        except ValueError:
-            slots_needed = 1
-
-        for i, slot in enumerate(slots):
-            if not slot['available'] or i + slots_needed > len(slots):
-                slot['available_as_start'] = False
-                continue
-            slot_start_dt = datetime.combine(fecha, datetime.strptime(slot['time'], '%H:%M').time())
-            slot_end_dt = slot_start_dt + timedelta(hours=slots_needed)
-            overlaps = Booking.objects.filter(
-                status='CONFIRMED',
-                start_datetime__lt=slot_end_dt,
-                end_datetime__gt=slot_start_dt,
-            ).exists()
-            slot['available_as_start'] = not overlaps
-
-    return JsonResponse({
-        'slots': slots,
-        'fecha': fecha.strftime('%Y-%m-%d'),
-        'resource_id': resource.id,
-        'resource_name': resource.name,
-        'has_availability': any(s['available'] for s in slots),
-    })
+    return await aavailability_response(
+        request, ('slots', resource_id, fecha, slots_needed, staff_mode), compute
+    )
 
 
 @require_http_methods(['GET'])
-def dias_disponibilidad_api(request):
+async def dias_disponibilidad_api(request):
     """Get availability status for multiple days (for day indicators)"""
     resource_id = request.GET.get('resource_id')
     from_date_str = request.GET.get('from_date')
@@ -193,13 +147,16 @@ def dias_disponibilidad_api(request):
         return JsonResponse({'error': 'Parámetro resource_id requerido'}, status=400)
 
     try:
-        resource = Resource.objects.get(id=resource_id, active=True)
         days = int(days)
-    except Resource.DoesNotExist:
-        return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
     except ValueError:
         return JsonResponse({'error': 'Parámetro days debe ser un número'}, status=400)
 
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        return JsonResponse(
+            {'error': f'Parámetro days debe estar entre 1 y {MAX_WINDOW_DAYS}'},
+            status=400
+        )
+
     if from_date_str:
         try:
             today = datetime.strptime(from_date_str, '%Y-%m-%d').date()
@@ -208,27 +165,242 @@ def dias_disponibilidad_api(request):
     else:
         today = datetime.now().date()
 
-    days_info = []
-    for i in range(days):
-        fecha = today + timedelta(days=i)
-        slots = _get_slots_for_date(resource, fecha)
-        has_any_available = False
+    async def compute():
+        try:
+            resource = await Resource.objects.aget(id=resource_id, active=True)
+        except Resource.DoesNotExist:
+            return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
+        except ValueError:
+            return JsonResponse({'error': 'Parámetro resource_id debe ser un número'}, status=400)
+
+        return JsonResponse({'days': await aget_days_overview(resource, today, days)})
 
-        if slots:
-            has_any_available = any(s['available'] for s in slots)
+    return await aavailability_response(request, ('days', resource_id, today, days), compute)
 
-        days_info.append({
-            'fecha': fecha.strftime('%Y-%m-%d'),
-            'weekday': fecha.weekday(),
-            'has_availability': bool(slots) and has_any_available,
-            'has_schedule': bool(slots),
+
+@require_http_methods(['GET'])
+async def mes_disponibilidad_api(request):
+    """
+    Disponibilidad de un mes entero en formato compacto (ver get_month_grid).
+    El calendario arma con esto los indicadores de días y la grilla de slots
+    de cualquier día sin volver a pedir nada.
+    """
+    resource_id = request.GET.get('resource_id')
+    month_str = request.GET.get('month')
+
+    if not resource_id:
+        return JsonResponse({'error': 'Parámetro resource_id requerido'}, status=400)
+
+    if month_str:
+        try:
+            month = datetime.strptime(month_str, '%Y-%m').date()
+        except ValueError:
+            return JsonResponse({'error': 'Formato month inválido (use YYYY-MM)'}, status=400)
+    else:
+        month = datetime.now().date().replace(day=1)
+
+    staff_mode = request.GET.get('staff_mode') == 'true' and (await request.auser()).is_staff
+
+    async def compute():
+        try:
+            resource = await Resource.objects.aget(id=resource_id, active=True)
+        except Resource.DoesNotExist:
+            return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
+        except ValueError:
+            return JsonResponse({'error': 'Parámetro resource_id debe ser un número'}, status=400)
+
+        return JsonResponse({
+            'month': month.strftime('%Y-%m'),
+            'resource_id': resource.id,
+            'days': await aget_month_grid(resource, month.year, month.month, staff=staff_mode),
+        })
+
+    return await aavailability_response(
+        request, ('month', resource_id, month, staff_mode), compute
+    )
+
+
+@require_http_methods(['GET'])
+async def huecos_libres_api(request):
+    """
+    Próximos huecos libres donde entra un producto (ver find_free_windows).
+
+    Parámetros: product_id; after (YYYY-MM-DD o YYYY-MM-DDTHH:MM, por defecto
+    ahora); duration_minutes (por defecto el bloque mínimo del producto);
+    count (por defecto 3).
+    """
+    product_id = request.GET.get('product_id')
+    after_str = request.GET.get('after')
+
+    if not product_id:
+        return JsonResponse({'error': 'Parámetro product_id requerido'}, status=400)
+
+    try:
+        count = int(request.GET.get('count', '3'))
+        duration_minutes = int(request.GET.get('duration_minutes') or 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'count y duration_minutes deben ser números'}, status=400)
+
+    if not 1 <= count <= MAX_FREE_WINDOWS:
+        return JsonResponse(
+            {'error': f'Parámetro count debe estar entre 1 y {MAX_FREE_WINDOWS}'},
+            status=400
+        )
+
+    if after_str:
+        try:
+            fmt = '%Y-%m-%dT%H:%M' if 'T' in after_str else '%Y-%m-%d'
+            after = datetime.strptime(after_str, fmt).replace(tzinfo=ASUNCION)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Formato after inválido (use YYYY-MM-DD o YYYY-MM-DDTHH:MM)'},
+                status=400
+            )
+    else:
+        after = datetime.now(ASUNCION).replace(second=0, microsecond=0)
+
+    async def compute():
+        try:
+            product = await (
+                Product.objects.select_related('resource').prefetch_related('packages')
+                .aget(id=product_id, is_active=True, resource__active=True)
+            )
+        except Product.DoesNotExist:
+            return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+        except ValueError:
+            return JsonResponse({'error': 'Parámetro product_id debe ser un número'}, status=400)
+
+        minutes = duration_minutes or default_window_minutes(product)
+        windows = await afind_free_windows(
+            product.resource, after, timedelta(minutes=minutes), count=count
+        )
+        return JsonResponse({
+            'product_id': product.id,
+            'duration_minutes': minutes,
+            'windows': [
+                {
+                    'fecha': w['start'].strftime('%Y-%m-%d'),
+                    'start': w['start'].strftime('%H:%M'),
+                    'end': w['end'].strftime('%H:%M'),
+                }
+                for w in windows
+            ],
         })
 
-    return JsonResponse({'days': days_info})
+    return await aavailability_response(
+        request, ('free', product_id, after, duration_minutes, count), compute
+    )
+
+
+@require_http_methods(['GET'])
+async def eventos_disponibilidad(request):
+    """
+    Stream SSE: avisa qué días cambiaron para que el calendario refresque solo
+    esos. Al reconectar, EventSource manda Last-Event-ID y sigue desde ahí.
+    """
+    response = StreamingHttpResponse(
+        availability_events(request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Que nginx no junte los eventos en su buffer.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(['POST'])
+@csrf_exempt
+def disponibilidad_lote_api(request):
+    """
+    Chequea varios horarios candidatos en un solo pedido (ver check_candidates).
+
+    Body: {"resource_id": 1, "candidates": [{"fecha": "YYYY-MM-DD",
+    "start_time": "HH:MM", "end_time": "HH:MM"}, ...]}. Los datos del cliente
+    de cada reserva en conflicto solo se devuelven a staff.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    resource_id = data.get('resource_id')
+    raw_candidates = data.get('candidates')
+
+    if not resource_id or not isinstance(raw_candidates, list) or not raw_candidates:
+        return JsonResponse({'error': 'Parámetros requeridos: resource_id, candidates'}, status=400)
+
+    if len(raw_candidates) > MAX_BATCH_CANDIDATES:
+        return JsonResponse(
+            {'error': f'Se permiten hasta {MAX_BATCH_CANDIDATES} candidatos por pedido'},
+            status=400
+        )
+
+    candidates = []
+    try:
+        for item in raw_candidates:
+            fecha = datetime.strptime(item['fecha'], '%Y-%m-%d').date()
+            start_time = datetime.strptime(item['start_time'], '%H:%M').time()
+            end_time = datetime.strptime(item['end_time'], '%H:%M').time()
+            if end_time <= start_time:
+                raise ValueError
+            candidates.append((fecha, start_time, end_time))
+    except (TypeError, KeyError, ValueError):
+        return JsonResponse(
+            {'error': 'Cada candidato necesita fecha (YYYY-MM-DD), start_time y end_time '
+                      '(HH:MM) con fin posterior al inicio'},
+            status=400
+        )
+
+    try:
+        resource = Resource.objects.get(id=resource_id, active=True)
+    except Resource.DoesNotExist:
+        return JsonResponse({'error': 'Recurso no encontrado'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro resource_id debe ser un número'}, status=400)
+
+    is_staff = request.user.is_staff
+
+    def conflict_info(booking):
+        info = {
+            'start': booking.start_datetime.isoformat(),
+            'end': booking.end_datetime.isoformat(),
+        }
+        if is_staff:
+            info['client_name'] = booking.client_name
+            info['reservation_code'] = booking.reservation_code
+        return info
+
+    return JsonResponse({
+        'resource_id': resource.id,
+        'results': [
+            {
+                'fecha': r['fecha'].strftime('%Y-%m-%d'),
+                'start_time': r['start_time'].strftime('%H:%M'),
+                'end_time': r['end_time'].strftime('%H:%M'),
+                'available': r['available'],
+                'within_schedule': r['within_schedule'],
+                'schedule': [t.strftime('%H:%M') for t in r['schedule']] if r['schedule'] else None,
+                'conflicts': [conflict_info(b) for b in r['conflicts']],
+            }
+            for r in check_candidates(resource, candidates)
+        ],
+    })
+
+
+def _staff_identity(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return client_ip(request)
 
 
+# Público: hasta 5 solicitudes seguidas por IP y 5 cada 10 minutos sostenido.
+# Un reintento con una Idempotency-Key ya guardada no gasta: recibe la
+# respuesta original aunque el cliente esté sin tokens.
 @require_http_methods(['POST'])
 @csrf_exempt
+@rate_limited('pending_booking', limit=5, window_seconds=600,
+              skip=has_stored_key('pending_booking'))
+@idempotent('pending_booking')
 def create_pending_booking(request):
     """Create a pending booking and return a reservation code"""
     try:
@@ -278,11 +450,7 @@ def create_pending_booking(request):
                 return JsonResponse({'error': 'Duración inválida para Fractabox'}, status=400)
 
         # Verificar solapamiento con reservas confirmadas
-        overlapping = Booking.objects.filter(
-            status='CONFIRMED',
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt,
-        ).exists()
+        overlapping = Booking.objects.confirmed_overlapping(start_dt, end_dt).exists()
         if overlapping:
             return JsonResponse({'error': 'Este horario ya está ocupado por otra reserva.'}, status=409)
 
@@ -303,8 +471,10 @@ def create_pending_booking(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+# Staff: por usuario, holgado; solo frena un script o un doble click en loop.
 @require_http_methods(['POST'])
 @csrf_exempt
+@rate_limited('reserva_directa', limit=60, window_seconds=60, identity=_staff_identity)
 def reserva_directa(request):
     """Crea una Booking confirmada directamente (solo is_staff). Salta restricciones de horario."""
     if not request.user.is_authenticated or not request.user.is_staff:
@@ -347,44 +517,28 @@ def reserva_directa(request):
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha/hora inválido'}, status=400)
 
+    booking_code = generate_reservation_code()
+    notes = f'Reserva directa por admin. Código: {booking_code}'
     try:
-        duration_hours = int((end_dt - start_dt).total_seconds() / 3600)
-        package = None
-        if product.product_type == 'FRACTABOX':
-            package = get_fractabox_package_for_hours(product, duration_hours)
-            # Admin puede saltar la restricción de paquete si no encuentra uno exacto
-            # En ese caso se guarda sin paquete asociado
-
-        booking_code = generate_reservation_code()
-
-        # Siempre crear PendingBooking como registro de origen
-        pending = PendingBooking.objects.create(
-            resource=product.resource,
-            product=product,
-            date=fecha,
-            start_time=start_dt.time(),
-            end_time=end_dt.time(),
-            reservation_code=booking_code,
-            client_name=client_name,
-            client_phone=client_phone,
-            status='CONFIRMED',
-            notes=f'Reserva directa por admin. Código: {booking_code}',
-        )
-
-        booking = Booking(
-            resource=product.resource,
-            product=product,
-            fractabox_package=package,
-            reservation_code=booking_code,
-            client_name=client_name,
-            client_phone=client_phone,
-            start_datetime=start_dt,
-            end_datetime=end_dt,
-            status='CONFIRMED',
-            notes=f'Reserva directa por admin. Código: {booking_code}',
-        )
-        # Admins siempre saltan la restricción de horario de disponibilidad
-        booking.save(skip_availability_check=True)
+        # Siempre se crea la PendingBooking como registro de origen; si la
+        # confirmación falla, la transacción no deja ninguna de las dos.
+        with transaction.atomic():
+            pending = PendingBooking.objects.create(
+                resource=product.resource,
+                product=product,
+                date=fecha,
+                start_time=start_dt.time(),
+                end_time=end_dt.time(),
+                reservation_code=booking_code,
+                client_name=client_name,
+                client_phone=client_phone,
+                notes=notes,
+            )
+            # Admins siempre saltan el horario de disponibilidad, y un Fractabox
+            # sin paquete exacto se guarda sin paquete asociado
+            booking = confirm_pending_booking(
+                pending, check_schedule=False, require_package=False, notes=notes,
+            )
         return JsonResponse({
             'id': booking.id,
             'code': booking.reservation_code,
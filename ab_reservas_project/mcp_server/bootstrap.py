@@ -17,6 +17,8 @@ django.setup()
 
 from django.db import close_old_connections  # noqa: E402
 
+from ab_reservas_project.querybudget import track  # noqa: E402
+
 ASUNCION = zoneinfo.ZoneInfo("America/Asuncion")
 
 DIAS = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
@@ -148,7 +150,8 @@ def con_db(fn):
     por hilo. Sin esto quedan conexiones colgadas.
 
     De paso deja registrado el uso, que es lo que después responde "qué se usa
-    de verdad" sin tener que preguntarle a nadie.
+    de verdad" sin tener que preguntarle a nadie, y mide las consultas del tool
+    contra QUERY_BUDGET (ab_reservas_project/querybudget.py).
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -157,7 +160,8 @@ def con_db(fn):
         inicio = time.monotonic()
         exito, error = True, ""
         try:
-            resultado = fn(*args, **kwargs)
+            with track(f"mcp:{fn.__name__}"):
+                resultado = fn(*args, **kwargs)
             # Los tools devuelven ok=False para errores esperados; eso también
             # es señal: un tool que "funciona" pero siempre dice que no, molesta.
             if isinstance(resultado, dict) and resultado.get("ok") is False:
@@ -0,0 +1,189 @@
+"""
+Índice en memoria de las reservas confirmadas que vienen.
+
+Los tools de lectura preguntan muchas veces lo mismo —¿esto choca con algo
+confirmado?, ¿qué queda libre esta semana?— y cada pregunta era una consulta.
+El proceso del MCP guarda las reservas CONFIRMED desde hoy en adelante,
+ordenadas por inicio, y responde solapamientos y huecos con búsqueda binaria.
+
+Frescura:
+  - PostgreSQL: un hilo hace LISTEN sobre el canal que notifica
+    bump_booking_generation (app_fractalia/cache.py). Cada aviso marca el
+    índice como sucio y la próxima lectura lo recarga.
+  - SQLite (o si el hilo se cayó): cada lectura compara el contador de
+    BookingGeneration con el que se cargó; es una consulta de una fila.
+
+El índice solo sirve para leer. Los tools que escriben (confirmar, crear,
+bloquear) vuelven a chequear en la base antes de guardar: entre el aviso y la
+recarga hay una ventana chica en la que el índice puede estar atrasado, y la
+garantía la dan Booking.clean() y la restricción de exclusión.
+"""
+import bisect
+import logging
+import threading
+import time as _reloj
+from collections import namedtuple
+from datetime import datetime, time as _time
+
+from .bootstrap import ASUNCION, hoy
+
+from app_fractalia.cache import BOOKINGS_CHANNEL  # noqa: E402
+from app_fractalia.models import Booking, BookingGeneration  # noqa: E402
+
+log = logging.getLogger(__name__)
+
+# Lo justo para cliente_str() y para ubicar la reserva.
+Reserva = namedtuple("Reserva", "inicio fin id client_name client_phone reservation_code")
+
+_CAMPOS = ("start_datetime", "end_datetime", "id", "client_name", "client_phone",
+           "reservation_code")
+
+# Cada cuánto el hilo de LISTEN se despierta aunque no lleguen avisos, y cuánto
+# espera antes de reconectar si se cortó la conexión.
+ESPERA_AVISOS = 30  # segundos
+ESPERA_RECONEXION = 5  # segundos
+
+
+def _generacion_actual():
+    return BookingGeneration.objects.filter(pk=1).values_list("generation", flat=True).first() or 0
+
+
+class IndiceReservas:
+    """
+    Reservas confirmadas desde el inicio de `desde` (hoy al cargar), ordenadas
+    por inicio. Además del arreglo de inicios guarda el máximo acumulado de los
+    fines: como es no decreciente, la primera reserva que puede solapar un
+    intervalo también sale por bisección.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reservas = []
+        self._inicios = []
+        self._fin_max = []
+        self._desde = None
+        self._generacion = None
+        self._sucio = threading.Event()
+        self._sucio.set()
+        self._escuchando = False
+        self._hilo = None
+
+    # ── carga y frescura ──────────────────────────────────────────────────
+
+    def _cargar(self):
+        # Primero el contador: si algo cambia mientras se lee, la próxima
+        # lectura lo nota y vuelve a cargar.
+        generacion = _generacion_actual()
+        desde = datetime.combine(hoy(), _time.min).replace(tzinfo=ASUNCION)
+        filas = (Booking.objects.filter(status="CONFIRMED", end_datetime__gt=desde)
+                 .order_by("start_datetime").values_list(*_CAMPOS))
+        reservas = [Reserva(*f) for f in filas]
+        fin_max, tope = [], None
+        for r in reservas:
+            tope = r.fin if tope is None or r.fin > tope else tope
+            fin_max.append(tope)
+        self._reservas = reservas
+        self._inicios = [r.inicio for r in reservas]
+        self._fin_max = fin_max
+        self._desde = desde
+        self._generacion = generacion
+
+    def _al_dia(self):
+        """Recarga si hace falta. Se llama con el lock tomado."""
+        self._arrancar_escucha()
+        if self._desde is not None and self._desde.date() != hoy():
+            # Cambió el día: se descartan las de ayer.
+            self._sucio.set()
+        if not self._escuchando and not self._sucio.is_set():
+            if _generacion_actual() != self._generacion:
+                self._sucio.set()
+        if self._sucio.is_set():
+            # Se limpia antes de cargar: un aviso que llegue durante la carga
+            # deja el índice sucio otra vez.
+            self._sucio.clear()
+            self._cargar()
+
+    def invalidar(self):
+        self._sucio.set()
+
+    # ── LISTEN/NOTIFY ─────────────────────────────────────────────────────
+
+    def _arrancar_escucha(self):
+        from django.db import connection
+        if connection.vendor != "postgresql":
+            return
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._escuchar, name="indice-reservas",
+                                          daemon=True)
+            self._hilo.start()
+
+    def _escuchar(self):
+        # Conexión propia del hilo (Django abre una por hilo), en autocommit.
+        from django.db import connection
+        while True:
+            try:
+                connection.ensure_connection()
+                pg = connection.connection
+                with pg.cursor() as cur:
+                    cur.execute(f"LISTEN {BOOKINGS_CHANNEL}")
+                self._escuchando = True
+                # Lo que cambió antes del LISTEN no llegó como aviso.
+                self._sucio.set()
+                while True:
+                    for _ in pg.notifies(timeout=ESPERA_AVISOS):
+                        self._sucio.set()
+                    if pg.closed:
+                        raise ConnectionError("conexión cerrada")
+            except Exception:
+                log.warning("Índice de reservas: se cortó el LISTEN, reintentando.",
+                            exc_info=True)
+            finally:
+                # Sin aviso posible, las lecturas vuelven a mirar el contador.
+                self._escuchando = False
+                self._sucio.set()
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            _reloj.sleep(ESPERA_RECONEXION)
+
+    # ── consultas ─────────────────────────────────────────────────────────
+
+    def _desde_base(self, inicio, fin):
+        filas = (Booking.objects.confirmed_overlapping(inicio, fin)
+                 .order_by("start_datetime").values_list(*_CAMPOS))
+        return [Reserva(*f) for f in filas]
+
+    def solapadas(self, inicio, fin):
+        """
+        Reservas confirmadas que pisan [inicio, fin), ordenadas por inicio.
+        O(log n + k). Lo anterior a hoy no está en el índice y va a la base.
+        """
+        with self._lock:
+            self._al_dia()
+            if inicio < self._desde:
+                return self._desde_base(inicio, fin)
+            hasta = bisect.bisect_left(self._inicios, fin)
+            i = bisect.bisect_right(self._fin_max, inicio, 0, hasta)
+            return [r for r in self._reservas[i:hasta] if r.fin > inicio]
+
+    def primera_solapada(self, inicio, fin):
+        solapadas = self.solapadas(inicio, fin)
+        return solapadas[0] if solapadas else None
+
+    def libre(self, inicio, fin) -> bool:
+        return not self.solapadas(inicio, fin)
+
+    def huecos(self, inicio, fin):
+        """Tramos libres (inicio, fin) dentro de [inicio, fin), en orden."""
+        out, cursor = [], inicio
+        for r in self.solapadas(inicio, fin):
+            if r.inicio > cursor:
+                out.append((cursor, r.inicio))
+            cursor = max(cursor, r.fin)
+        if cursor < fin:
+            out.append((cursor, fin))
+        return out
+
+
+indice = IndiceReservas()
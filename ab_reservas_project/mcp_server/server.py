@@ -12,18 +12,24 @@ que ya existe en el admin de Django (app_fractalia/admin.py):
 No hay migraciones: usa la ORM y el LogEntry integrado de Django.
 """
 import os
-from datetime import timedelta
+from datetime import time, timedelta
 
 from fastmcp import FastMCP
 from mcp.types import ToolAnnotations
 
 from .auth import construir_auth
 from .icono import ICONOS
+from .indice import indice
 from .bootstrap import (
     ahora, hoy, dt_de, fecha_larga, parse_fecha, parse_hora,
     cliente_str, whatsapp, telefono_internacional, con_db, registrar,
 )
 
+from ab_reservas_project.localtime import day_filter  # noqa: E402
+from app_fractalia.availability import (  # noqa: E402
+    check_candidates, find_free_windows, schedule_hours, slot_windows, weekly_schedule,
+)
+from app_fractalia.confirmation import ConfirmationError, confirm_pending_booking  # noqa: E402
 from app_fractalia.models import (  # noqa: E402
     Booking, PendingBooking, Product, Resource,
     generate_reservation_code, get_fractabox_package_for_hours,
@@ -249,11 +255,19 @@ def _duracion_horas(pb) -> int:
 
 def _choca_con_confirmada(pb) -> bool:
     """La pre-reserva solapa con una Booking ya confirmada."""
-    return Booking.objects.filter(
-        status="CONFIRMED",
-        start_datetime__lt=dt_de(pb.date, pb.end_time),
-        end_datetime__gt=dt_de(pb.date, pb.start_time),
-    ).exists()
+    return not indice.libre(dt_de(pb.date, pb.start_time), dt_de(pb.date, pb.end_time))
+
+
+def _slots_del_dia(horario, f):
+    """
+    [(hora, reserva que la ocupa o None)] del día según el horario semanal,
+    resuelto contra el índice. None si ese día no hay horario configurado.
+    """
+    disponibilidad = horario.get(f.weekday())
+    if not disponibilidad:
+        return None
+    return [(hora.strftime("%H:%M"), indice.primera_solapada(inicio, fin))
+            for hora, inicio, fin in slot_windows(f, *schedule_hours(disponibilidad))]
 
 
 def _compiten(pb):
@@ -315,22 +329,21 @@ def _buscar(codigo: str):
 
 
 def _booking_de(pb):
-    """El admin busca por notes; acá cubrimos ambos campos."""
-    from django.db.models import Q
-    return Booking.objects.filter(
-        Q(reservation_code=pb.reservation_code) | Q(notes__contains=pb.reservation_code)
-    ).first()
+    return Booking.objects.filter(pending_booking=pb).first()
 
 
 def _no_encontrada(codigo):
     return {"ok": False, "error": f"No existe ninguna pre-reserva con código {codigo}."}
 
 
-def _reglas_de_negocio(prod, f, hi, hf) -> list:
+def _reglas_de_negocio(prod, f, hi, hf, chequeo) -> list:
     """
     Reglas que el formulario público impone y que un alta directa podría saltear
     sin querer. Se devuelven como advertencias: el staff puede forzarlas —igual
     que reserva_directa en las vistas— pero nunca en silencio.
+
+    `chequeo` es el resultado de check_candidates para este horario: de ahí sale
+    el veredicto de horario semanal sin volver a consultar.
     """
     avisos = []
 
@@ -363,15 +376,13 @@ def _reglas_de_negocio(prod, f, hi, hf) -> list:
                       f"horas. Estás cargando {horas}h, que el calendario público "
                       f"no permitiría.")
 
-    from app_fractalia.models import WeeklyAvailability
-    disp = WeeklyAvailability.objects.filter(
-        resource=prod.resource if prod else None, weekday=f.weekday()).first()
-    if not disp:
+    if not chequeo["schedule"]:
         avisos.append(f"No hay horario configurado para los "
                       f"{['lunes','martes','miércoles','jueves','viernes','sábados','domingos'][f.weekday()]}.")
-    elif not (disp.start_time <= hi and hf <= disp.end_time):
+    elif not chequeo["within_schedule"]:
+        desde, hasta = chequeo["schedule"]
         avisos.append(f"Queda fuera del horario de atención "
-                      f"({disp.start_time.strftime('%H:%M')}–{disp.end_time.strftime('%H:%M')}).")
+                      f"({desde.strftime('%H:%M')}–{hasta.strftime('%H:%M')}).")
 
     return avisos
 
@@ -486,46 +497,24 @@ def confirmar_reserva(codigo: str) -> dict:
         return {"ok": False, "error": f"{cliente_str(pb)} ya está en estado "
                                       f"'{pb.get_status_display()}', no se puede confirmar."}
 
-    if _choca_con_confirmada(pb):
-        otras = Booking.objects.filter(
-            status="CONFIRMED",
-            start_datetime__lt=dt_de(pb.date, pb.end_time),
-            end_datetime__gt=dt_de(pb.date, pb.start_time),
-        )
-        return {
-            "ok": False,
-            "error": "Ese horario ya está confirmado para otra persona.",
-            "ocupado_por": [cliente_str(b) for b in otras],
-            "sugerencia": f"Podés usar rechazar_solicitud('{pb.reservation_code}') con el motivo, "
-                          f"o ver_agenda('{pb.date.isoformat()}') para ofrecer otro horario.",
-        }
-
-    paquete = None
-    if pb.product and pb.product.product_type == "FRACTABOX":
-        paquete = get_fractabox_package_for_hours(pb.product, _duracion_horas(pb))
-        if not paquete:
+    # El servicio chequea todo en la base bajo el lock del día: acá no se
+    # usa el índice, que puede venir atrasado unos instantes.
+    try:
+        booking = confirm_pending_booking(pb)
+    except ConfirmationError as e:
+        if e.code == "overlap":
+            return {
+                "ok": False,
+                "error": "Ese horario ya está confirmado para otra persona.",
+                "ocupado_por": [cliente_str(b) for b in e.conflicts],
+                "sugerencia": f"Podés usar rechazar_solicitud('{pb.reservation_code}') con el motivo, "
+                              f"o ver_agenda('{pb.date.isoformat()}') para ofrecer otro horario.",
+            }
+        if e.code == "package":
             return {"ok": False, "error": "La duración no coincide con ningún paquete "
                                           "Fractabox activo. Revisalo en el admin."}
+        return {"ok": False, "error": f"No se pudo confirmar: {e}"}
 
-    try:
-        booking = Booking.objects.create(
-            resource=pb.resource,
-            product=pb.product,
-            fractabox_package=paquete,
-            reservation_code=pb.reservation_code,
-            client_name=pb.client_name,
-            client_phone=pb.client_phone,
-            start_datetime=dt_de(pb.date, pb.start_time),
-            end_datetime=dt_de(pb.date, pb.end_time),
-            status="CONFIRMED",
-            notes=f"Código de reserva: {pb.reservation_code}",
-        )
-    except Exception as e:
-        limpio = str(e).replace('["__all__"]', "").strip("[]{}'\" ")
-        return {"ok": False, "error": f"No se pudo confirmar: {limpio}"}
-
-    pb.status = "CONFIRMED"
-    pb.save()
     registrar(pb, "cambio", f"Confirmada por MCP -> Booking #{booking.id}")
 
     compiten = _compiten(pb)
@@ -548,8 +537,8 @@ def confirmar_reserva(codigo: str) -> dict:
 def rechazar_solicitud(codigo: str, motivo: str = "") -> dict:
     """
     Marca la pre-reserva como respondida sin confirmar el turno: el cliente fue
-    contactado pero no se le reserva el horario. Devuelve horarios libres cercanos
-    para poder ofrecerle una alternativa.
+    contactado pero no se le reserva el horario. Devuelve los próximos horarios
+    libres donde entra la misma duración, para poder ofrecerle una alternativa.
 
     Usalo cuando la persona encargada te diga que esta no pasa.
     """
@@ -575,23 +564,27 @@ def rechazar_solicitud(codigo: str, motivo: str = "") -> dict:
     }
 
 
-def _libres_cerca(pb, dias: int = 7) -> list:
-    """Huecos libres alrededor de lo que el cliente pidió."""
-    from app_fractalia.views import _get_slots_for_date
+def _libres_cerca(pb, cuantos: int = 3) -> list:
+    """
+    Próximos huecos donde entra lo que el cliente pidió (misma duración), desde
+    el día que pidió o desde ahora si ese día ya empezó. Las reservas salen del
+    índice en memoria.
+    """
+    duracion = dt_de(pb.date, pb.end_time) - dt_de(pb.date, pb.start_time)
+    desde = max(dt_de(pb.date, time.min), ahora())
+    huecos = find_free_windows(
+        pb.resource, desde, duracion, count=cuantos,
+        intervals_for=lambda a, b: [(r.inicio, r.fin) for r in indice.solapadas(a, b)],
+    )
     out = []
-    for i in range(dias):
-        f = pb.date + timedelta(days=i)
-        if f < hoy():
-            continue
-        slots = _get_slots_for_date(pb.resource, f)
-        if not slots:
-            continue
-        libres = [s["time"] for s in slots if s["available"]]
-        if libres:
-            out.append({"fecha": f.isoformat(), "fecha_legible": fecha_larga(f),
-                        "horarios_libres": libres})
-        if len(out) >= 3:
-            break
+    for h in huecos:
+        inicio, fin = h["start"], h["end"]
+        out.append({
+            "fecha": inicio.date().isoformat(),
+            "fecha_legible": fecha_larga(inicio.date()),
+            "horario": f"{inicio.strftime('%H:%M')}–{(inicio + duracion).strftime('%H:%M')}",
+            "libre_hasta": fin.strftime("%H:%M"),
+        })
     return out
 
 
@@ -646,14 +639,15 @@ def crear_reserva(cliente: str, telefono: str, producto: str, fecha: str,
     if fin <= inicio:
         return {"ok": False, "error": "La hora de fin debe ser posterior a la de inicio."}
 
-    choque = Booking.objects.filter(status="CONFIRMED",
-                                    start_datetime__lt=fin, end_datetime__gt=inicio)
-    if choque.exists():
+    # Los tools que escriben chequean contra la base, no contra el índice.
+    # Una sola pasada trae los choques y el veredicto de horario semanal.
+    chequeo = check_candidates(prod.resource, [(f, hi, hf)])[0]
+    if chequeo["conflicts"]:
         return {"ok": False, "error": "Ese horario ya está ocupado.",
-                "ocupado_por": [cliente_str(b) for b in choque]}
+                "ocupado_por": [cliente_str(b) for b in chequeo["conflicts"]]}
 
     # Reglas del formulario público. Sin forzar=True no se saltean en silencio.
-    avisos = _reglas_de_negocio(prod, f, hi, hf)
+    avisos = _reglas_de_negocio(prod, f, hi, hf, chequeo)
     if avisos and not forzar:
         return {"ok": False,
                 "error": "La reserva no cumple las reglas del calendario público.",
@@ -675,7 +669,7 @@ def crear_reserva(cliente: str, telefono: str, producto: str, fecha: str,
         notes=f"Alta directa desde MCP. Código: {codigo}",
     )
     booking = Booking(
-        resource=prod.resource, product=prod, fractabox_package=paquete,
+        pending_booking=pb, resource=prod.resource, product=prod, fractabox_package=paquete,
         reservation_code=codigo, client_name=cliente.strip(), client_phone=tel,
         start_datetime=inicio, end_datetime=fin, status="CONFIRMED",
         notes=f"Alta directa desde MCP. Código: {codigo}",
@@ -723,8 +717,8 @@ def bloquear_horario(fecha: str, hora_inicio: str, hora_fin: str, motivo: str =
     inicio, fin = dt_de(f, hi), dt_de(f, hf)
     if fin <= inicio:
         return {"ok": False, "error": "La hora de fin debe ser posterior a la de inicio."}
-    if Booking.objects.filter(status="CONFIRMED",
-                              start_datetime__lt=fin, end_datetime__gt=inicio).exists():
+    # Contra la base, no contra el índice: esto escribe.
+    if Booking.objects.confirmed_overlapping(inicio, fin).exists():
         return {"ok": False, "error": "Ese horario ya está ocupado."}
 
     codigo = generate_reservation_code()
@@ -752,7 +746,6 @@ def ver_agenda(fecha: str, dias: int = 1) -> dict:
     confirmar que pisan cada horario — eso el calendario público NO lo muestra,
     porque solo bloquea con reservas ya confirmadas.
     """
-    from app_fractalia.views import _get_slots_for_date
     try:
         f0 = parse_fecha(fecha)
     except ValueError as e:
@@ -762,27 +755,23 @@ def ver_agenda(fecha: str, dias: int = 1) -> dict:
     if not recurso:
         return {"ok": False, "error": "No hay ningún recurso activo configurado."}
 
+    horario = weekly_schedule(recurso)
     dias_out = []
     for i in range(max(1, min(dias, 31))):
         f = f0 + timedelta(days=i)
-        slots = _get_slots_for_date(recurso, f)
+        slots = _slots_del_dia(horario, f)
         if slots is None:
             dias_out.append({"fecha": f.isoformat(), "fecha_legible": fecha_larga(f),
                              "sin_horario_configurado": True})
             continue
         pendientes = list(PendingBooking.objects.filter(status="PENDING", date=f))
         detalle = []
-        for s in slots:
-            h = parse_hora(s["time"])
+        for hora, ocupada in slots:
+            h = parse_hora(hora)
             pisan = [p for p in pendientes if p.start_time <= h < p.end_time]
-            ocupada = Booking.objects.filter(
-                status="CONFIRMED",
-                start_datetime__lt=dt_de(f, h) + timedelta(hours=1),
-                end_datetime__gt=dt_de(f, h),
-            ).first()
             detalle.append({
-                "hora": s["time"],
-                "estado": "ocupado" if not s["available"] else "libre",
+                "hora": hora,
+                "estado": "ocupado" if ocupada else "libre",
                 "reservado_por": cliente_str(ocupada) if ocupada else None,
                 "pre_reservas_sin_confirmar": [cliente_str(p) for p in pisan] or None,
             })
@@ -805,14 +794,14 @@ def resumen_del_dia() -> dict:
     ayer, semana = h - timedelta(days=1), h - timedelta(days=7)
 
     def nuevas(d):
-        return PendingBooking.objects.filter(created_at__date=d).count()
+        return PendingBooking.objects.filter(**day_filter("created_at", d, d)).count()
 
     def confirmadas_el(d):
-        return PendingBooking.objects.filter(status="CONFIRMED", created_at__date=d).count()
+        return PendingBooking.objects.filter(status="CONFIRMED", **day_filter("created_at", d, d)).count()
 
     pendientes = list(PendingBooking.objects.filter(status="PENDING"))
     vencidas = [p for p in pendientes if _vencida(p)]
-    hoy_reservas = Booking.objects.filter(status="CONFIRMED", start_datetime__date=h)
+    hoy_reservas = Booking.objects.filter(status="CONFIRMED", **day_filter("start_datetime", h, h))
 
     return {
         "fecha": fecha_larga(h),
@@ -896,10 +885,8 @@ def horarios_superpuestos() -> dict:
     con_confirmada, entre_si, vistos = [], [], set()
     for p in activas:
         if _choca_con_confirmada(p):
-            ocupa = Booking.objects.filter(
-                status="CONFIRMED",
-                start_datetime__lt=dt_de(p.date, p.end_time),
-                end_datetime__gt=dt_de(p.date, p.start_time)).first()
+            ocupa = indice.primera_solapada(dt_de(p.date, p.start_time),
+                                            dt_de(p.date, p.end_time))
             con_confirmada.append({
                 "cliente": cliente_str(p), "codigo": p.reservation_code,
                 "producto": _nombre_producto(p),
@@ -952,15 +939,16 @@ def cierre_de_pedidos(desde: str = "", hasta: str = "", agrupar_por: str = "mes"
     `agrupar_por`: mes, semana, producto, dia_semana u hora.
     Sin fechas, toma los últimos 180 días.
     """
-    from app_analytics.models import PageView
+    from app_analytics.hll import Sketch
+    from app_analytics.rollup import visit_rows
     try:
         d, h = _rango(desde, hasta)
     except ValueError as e:
         return {"ok": False, "error": str(e)}
 
     tz = ahora().tzinfo
-    pedidos = [p for p in PendingBooking.objects.select_related("product")
-               if d <= p.created_at.astimezone(tz).date() <= h]
+    pedidos = list(PendingBooking.objects.select_related("product")
+                   .filter(**day_filter("created_at", d, h)))
 
     def clave(p):
         f = p.created_at.astimezone(tz).date()
@@ -985,20 +973,19 @@ def cierre_de_pedidos(desde: str = "", hasta: str = "", agrupar_por: str = "mes"
 
     # Visitantes únicos al calendario, solo tiene sentido en cortes temporales
     if agrupar_por in ("mes", "semana"):
-        for v in PageView.objects.filter(page="fractalia_calendar"):
-            f = v.timestamp.astimezone(tz).date()
-            if not (d <= f <= h):
-                continue
+        for v in visit_rows(d, h, page="fractalia_calendar"):
+            f = v["day"]
             k = (f.strftime("%Y-%m") if agrupar_por == "mes"
                  else (f - timedelta(days=f.weekday())).isoformat())
             grupos.setdefault(k, {"solicitudes": 0, "confirmadas": 0,
                                   "respondidas": 0, "pendientes": 0})
-            grupos[k].setdefault("_ips", set()).add(v.ip_hash)
+            grupos[k].setdefault("_ips", Sketch()).merge_bytes(v["visitors"])
 
     filas = []
     for k in sorted(grupos):
         g = grupos[k]
-        visit = len(g.pop("_ips", ()) or ())
+        ips = g.pop("_ips", None)
+        visit = ips.count() if ips else 0
         fila = {"grupo": k, **g}
         if visit:
             fila["visitantes_calendario"] = visit
@@ -1027,31 +1014,31 @@ def visitas_al_sitio(desde: str = "", hasta: str = "", agrupar_por: str = "mes")
     Visitas al sitio. `agrupar_por`: mes, semana, pagina u origen.
     Sirve para separar un problema de demanda de uno de conversión.
     """
-    from app_analytics.models import PageView
+    from app_analytics.hll import Sketch
+    from app_analytics.rollup import visit_rows
     try:
         d, h = _rango(desde, hasta)
     except ValueError as e:
         return {"ok": False, "error": str(e)}
 
-    tz = ahora().tzinfo
+    # Días cerrados del agregado diario, hoy de las visitas crudas. Los únicos
+    # salen de unir los sketches del grupo: son una estimación (~2%).
     grupos = {}
-    for v in PageView.objects.all():
-        f = v.timestamp.astimezone(tz).date()
-        if not (d <= f <= h):
-            continue
+    for v in visit_rows(d, h):
+        f = v["day"]
         if agrupar_por == "pagina":
-            k = v.page
+            k = v["page"]
         elif agrupar_por == "origen":
-            k = v.referrer or "(directo)"
+            k = v["referrer"] or "(directo)"
         elif agrupar_por == "semana":
             k = (f - timedelta(days=f.weekday())).isoformat()
         else:
             k = f.strftime("%Y-%m")
-        g = grupos.setdefault(k, {"visitas": 0, "_ips": set()})
-        g["visitas"] += 1
-        g["_ips"].add(v.ip_hash)
+        g = grupos.setdefault(k, {"visitas": 0, "_ips": Sketch()})
+        g["visitas"] += v["views"]
+        g["_ips"].merge_bytes(v["visitors"])
 
-    filas = [{"grupo": k, "visitas": g["visitas"], "visitantes_unicos": len(g["_ips"])}
+    filas = [{"grupo": k, "visitas": g["visitas"], "visitantes_unicos": g["_ips"].count()}
              for k, g in grupos.items()]
     orden = (lambda x: x["grupo"]) if agrupar_por in ("mes", "semana") \
         else (lambda x: -x["visitas"])
@@ -1073,9 +1060,7 @@ def dias_y_horas_pedidos(desde: str = "", hasta: str = "") -> dict:
     except ValueError as e:
         return {"ok": False, "error": str(e)}
 
-    tz = ahora().tzinfo
-    pedidos = [p for p in PendingBooking.objects.all()
-               if d <= p.created_at.astimezone(tz).date() <= h]
+    pedidos = list(PendingBooking.objects.filter(**day_filter("created_at", d, h)))
 
     dias_nombre = ["lunes", "martes", "miércoles", "jueves", "viernes",
                    "sábado", "domingo"]
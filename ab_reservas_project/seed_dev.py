@@ -12,6 +12,7 @@ from datetime import time, timedelta, datetime as dt
 from django.utils import timezone
 from app_fractalia.models import Resource, PendingBooking, Booking, generate_reservation_code
 from app_analytics.models import PageView
+from app_analytics.rollup import rebuild as rebuild_daily_views
 
 now   = timezone.now()
 today = timezone.localdate()
@@ -91,6 +92,7 @@ for days_back in range(1, 45):
                     status='CONFIRMED',
                 )
                 PendingBooking.objects.filter(pk=pb.pk).update(created_at=created_at)
+                Booking.objects.filter(pk=booking.pk).update(pending_booking=pb)
                 confirmed_slots.add(h)
                 pb_stats['CONFIRMED'] += 1
             except Exception:
@@ -151,6 +153,7 @@ for days_ahead in [2, 3, 4, 6, 7, 8, 10]:
             start_dt = timezone.make_aware(dt.combine(day, time(h, 0)))
             end_dt   = timezone.make_aware(dt.combine(day, time(h+1, 0)))
             Booking.objects.create(
+                pending_booking=pb,
                 resource=res, start_datetime=start_dt, end_datetime=end_dt,
                 status='CONFIRMED', client_phone=phone,
                 notes=f'Código de reserva: {code}',
@@ -202,6 +205,9 @@ for days_back in range(30):
         )
         pv_count += 1
 
+# Los PageView del seed no pasan por el buffer: el agregado diario se arma acá.
+rebuild_daily_views(today - timedelta(days=29), today)
+
 print(f'PageViews: {pv_count}')
 
 # ── Resumen final ──────────────────────────────────────────────────────────